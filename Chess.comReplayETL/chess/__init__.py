@@ -13,13 +13,18 @@ __email__ = "niklas.fiekas@backscattering.de"
 
 __version__ = "1.11.0"
 
+import array
+import binascii
 import collections
 import copy
 import dataclasses
 import enum
 import math
+import os
 import re
 import itertools
+import struct
+import sys
 import typing
 
 from typing import ClassVar, Callable, Counter, Dict, Generic, Hashable, Iterable, Iterator, List, Literal, Mapping, Optional, SupportsInt, Tuple, Type, TypeVar, Union
@@ -513,11 +518,6 @@ def _sliding_attacks(square: Square, occupied: Bitboard, deltas: Iterable[int])
 def _step_attacks(square: Square, deltas: Iterable[int]) -> Bitboard:
     return _sliding_attacks(square, BB_ALL, deltas)
 
-BB_KNIGHT_ATTACKS: List[Bitboard] = [_step_attacks(sq, [17, 15, 10, 6, -17, -15, -10, -6]) for sq in SQUARES]
-BB_KING_ATTACKS: List[Bitboard] = [_step_attacks(sq, [9, 8, 7, 1, -9, -8, -7, -1]) for sq in SQUARES]
-BB_PAWN_ATTACKS: List[List[Bitboard]] = [[_step_attacks(sq, deltas) for sq in SQUARES] for deltas in [[-7, -9], [7, 9]]]
-
-
 def _edges(square: Square) -> Bitboard:
     return (((BB_RANK_1 | BB_RANK_8) & ~BB_RANKS[square_rank(square)]) |
             ((BB_FILE_A | BB_FILE_H) & ~BB_FILES[square_file(square)]))
@@ -547,28 +547,160 @@ def _attack_table(deltas: List[int]) -> Tuple[List[Bitboard], List[Dict[Bitboard
 
     return mask_table, attack_table
 
-BB_DIAG_MASKS, BB_DIAG_ATTACKS = _attack_table([-9, -7, 7, 9])
-BB_FILE_MASKS, BB_FILE_ATTACKS = _attack_table([-8, 8])
-BB_RANK_MASKS, BB_RANK_ATTACKS = _attack_table([-1, 1])
-
 
-def _rays() -> List[List[Bitboard]]:
+def _rays(diag_attacks: List[Dict[Bitboard, Bitboard]], rank_attacks: List[Dict[Bitboard, Bitboard]], file_attacks: List[Dict[Bitboard, Bitboard]]) -> List[List[Bitboard]]:
     rays: List[List[Bitboard]] = []
     for a, bb_a in enumerate(BB_SQUARES):
         rays_row: List[Bitboard] = []
         for b, bb_b in enumerate(BB_SQUARES):
-            if BB_DIAG_ATTACKS[a][0] & bb_b:
-                rays_row.append((BB_DIAG_ATTACKS[a][0] & BB_DIAG_ATTACKS[b][0]) | bb_a | bb_b)
-            elif BB_RANK_ATTACKS[a][0] & bb_b:
-                rays_row.append(BB_RANK_ATTACKS[a][0] | bb_a)
-            elif BB_FILE_ATTACKS[a][0] & bb_b:
-                rays_row.append(BB_FILE_ATTACKS[a][0] | bb_a)
+            if diag_attacks[a][0] & bb_b:
+                rays_row.append((diag_attacks[a][0] & diag_attacks[b][0]) | bb_a | bb_b)
+            elif rank_attacks[a][0] & bb_b:
+                rays_row.append(rank_attacks[a][0] | bb_a)
+            elif file_attacks[a][0] & bb_b:
+                rays_row.append(file_attacks[a][0] | bb_a)
             else:
                 rays_row.append(BB_EMPTY)
         rays.append(rays_row)
     return rays
 
-BB_RAYS = _rays()
+
+# Knight, king and pawn attacks, the masks and attacks of diagonal, file and
+# rank sliders, and the rays.
+_AttackTables = Tuple[
+    List[Bitboard], List[Bitboard], List[List[Bitboard]],
+    List[Bitboard], List[Dict[Bitboard, Bitboard]],
+    List[Bitboard], List[Dict[Bitboard, Bitboard]],
+    List[Bitboard], List[Dict[Bitboard, Bitboard]],
+    List[List[Bitboard]]]
+
+def _compute_attack_tables() -> _AttackTables:
+    knight_attacks = [_step_attacks(sq, [17, 15, 10, 6, -17, -15, -10, -6]) for sq in SQUARES]
+    king_attacks = [_step_attacks(sq, [9, 8, 7, 1, -9, -8, -7, -1]) for sq in SQUARES]
+    pawn_attacks = [[_step_attacks(sq, deltas) for sq in SQUARES] for deltas in [[-7, -9], [7, 9]]]
+    diag_masks, diag_attacks = _attack_table([-9, -7, 7, 9])
+    file_masks, file_attacks = _attack_table([-8, 8])
+    rank_masks, rank_attacks = _attack_table([-1, 1])
+    rays = _rays(diag_attacks, rank_attacks, file_attacks)
+    return (knight_attacks, king_attacks, pawn_attacks,
+            diag_masks, diag_attacks, file_masks, file_attacks, rank_masks, rank_attacks,
+            rays)
+
+# Computing the attack tables takes most of the time of importing this
+# module, so they are cached in the __pycache__ directory of the module. Bump
+# the version whenever the tables or their layout change.
+_ATTACK_CACHE_VERSION = 1
+_ATTACK_CACHE_HEADER = struct.Struct("<8sI16sI")  # Magic, cache version, library version, CRC-32 of the payload
+
+def _attack_cache_path() -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "__pycache__",
+                        f"attacks.v{_ATTACK_CACHE_VERSION}.{sys.byteorder}.bin")
+
+def _attack_cache_header(payload: bytes) -> bytes:
+    return _ATTACK_CACHE_HEADER.pack(b"chessatk", _ATTACK_CACHE_VERSION, __version__.encode(), binascii.crc32(payload))
+
+def _dump_attack_tables(tables: _AttackTables) -> bytes:
+    # Native 64-bit integers. Slider attacks are stored as the keys and then
+    # the values of each dict, in the order of the subsets of its mask.
+    (knight_attacks, king_attacks, pawn_attacks,
+     diag_masks, diag_attacks, file_masks, file_attacks, rank_masks, rank_attacks,
+     rays) = tables
+    values = array.array("Q", knight_attacks + king_attacks + pawn_attacks[0] + pawn_attacks[1])
+    for masks, attacks in [(diag_masks, diag_attacks), (file_masks, file_attacks), (rank_masks, rank_attacks)]:
+        values.extend(masks)
+        for square_attacks in attacks:
+            values.extend(square_attacks.keys())
+            values.extend(square_attacks.values())
+    for rays_row in rays:
+        values.extend(rays_row)
+    return values.tobytes()
+
+def _load_attack_tables(payload: bytes) -> _AttackTables:
+    values = array.array("Q")
+    values.frombytes(payload)
+    flat = values.tolist()
+    offset = 0
+
+    def take(n: int) -> List[Bitboard]:
+        nonlocal offset
+        if offset + n > len(flat):
+            raise ValueError("attack table cache is truncated")
+        offset += n
+        return flat[offset - n:offset]
+
+    knight_attacks = take(64)
+    king_attacks = take(64)
+    pawn_attacks = [take(64), take(64)]
+    sliders: List[Tuple[List[Bitboard], List[Dict[Bitboard, Bitboard]]]] = []
+    for _ in range(3):
+        masks = take(64)
+        attacks = []
+        for mask in masks:
+            subsets = take(1 << popcount(mask))
+            attacks.append(dict(zip(subsets, take(len(subsets)))))
+        sliders.append((masks, attacks))
+    rays = [take(64) for _ in SQUARES]
+    if offset != len(flat):
+        raise ValueError("attack table cache has trailing data")
+
+    (diag_masks, diag_attacks), (file_masks, file_attacks), (rank_masks, rank_attacks) = sliders
+    return (knight_attacks, king_attacks, pawn_attacks,
+            diag_masks, diag_attacks, file_masks, file_attacks, rank_masks, rank_attacks,
+            rays)
+
+def _attack_tables() -> _AttackTables:
+    path = _attack_cache_path()
+    try:
+        with open(path, "rb") as cache_file:
+            data = cache_file.read()
+        payload = data[_ATTACK_CACHE_HEADER.size:]
+        if data[:_ATTACK_CACHE_HEADER.size] == _attack_cache_header(payload):
+            return _load_attack_tables(payload)
+    except (OSError, ValueError):
+        pass
+
+    # Missing, stale or damaged cache.
+    tables = _compute_attack_tables()
+
+    # Written under the same conditions as bytecode. Best effort: a read-only
+    # installation computes the tables on every import, as before.
+    cache_directory = os.path.dirname(path)
+    if sys.dont_write_bytecode:
+        return tables
+    try:
+        os.makedirs(cache_directory, exist_ok=True)
+    except OSError:
+        return tables
+    if not os.access(cache_directory, os.W_OK):
+        return tables
+
+    payload = _dump_attack_tables(tables)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "wb") as cache_file:
+            cache_file.write(_attack_cache_header(payload) + payload)
+        os.replace(temp_path, path)
+    except OSError:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+    return tables
+
+BB_KNIGHT_ATTACKS: List[Bitboard]
+BB_KING_ATTACKS: List[Bitboard]
+BB_PAWN_ATTACKS: List[List[Bitboard]]
+BB_DIAG_MASKS: List[Bitboard]
+BB_DIAG_ATTACKS: List[Dict[Bitboard, Bitboard]]
+BB_FILE_MASKS: List[Bitboard]
+BB_FILE_ATTACKS: List[Dict[Bitboard, Bitboard]]
+BB_RANK_MASKS: List[Bitboard]
+BB_RANK_ATTACKS: List[Dict[Bitboard, Bitboard]]
+BB_RAYS: List[List[Bitboard]]
+(BB_KNIGHT_ATTACKS, BB_KING_ATTACKS, BB_PAWN_ATTACKS,
+ BB_DIAG_MASKS, BB_DIAG_ATTACKS, BB_FILE_MASKS, BB_FILE_ATTACKS, BB_RANK_MASKS, BB_RANK_ATTACKS,
+ BB_RAYS) = _attack_tables()
 
 def ray(a: Square, b: Square) -> Bitboard:
     return BB_RAYS[a][b]
@@ -1542,6 +1674,20 @@ class BaseBoard:
 
 BoardT = TypeVar("BoardT", bound="Board")
 
+_ZOBRIST_ARRAY: List[int] = []
+
+# Zobrist hash of the castling flags by castling rights and king squares.
+_ZOBRIST_CASTLING: Dict[int, int] = {}
+
+def _zobrist_array() -> List[int]:
+    # The Polyglot random numbers, so that Board.zobrist matches
+    # chess.polyglot.zobrist_hash(). Imported lazily, because chess.polyglot
+    # imports this module.
+    if not _ZOBRIST_ARRAY:
+        import chess.polyglot
+        _ZOBRIST_ARRAY.extend(chess.polyglot.POLYGLOT_RANDOM_ARRAY)
+    return _ZOBRIST_ARRAY
+
 class _BoardState:
 
     def __init__(self, board: Board) -> None:
@@ -1564,6 +1710,9 @@ class _BoardState:
         self.halfmove_clock = board.halfmove_clock
         self.fullmove_number = board.fullmove_number
 
+        self.zobrist_pieces = board._zobrist_pieces
+        self.transposition_key: Optional[Hashable] = None
+
     def restore(self, board: Board) -> None:
         board.pawns = self.pawns
         board.knights = self.knights
@@ -1584,6 +1733,8 @@ class _BoardState:
         board.halfmove_clock = self.halfmove_clock
         board.fullmove_number = self.fullmove_number
 
+        board._zobrist_pieces = self.zobrist_pieces
+
 class Board(BaseBoard):
     """
     A :class:`~chess.BaseBoard`, additional information representing
@@ -1702,6 +1853,9 @@ class Board(BaseBoard):
         self.ep_square = None
         self.move_stack = []
         self._stack: List[_BoardState] = []
+        self._zobrist_pieces: Optional[int] = None
+        self._repetitions: Optional[Counter[Hashable]] = None
+        self._repeated = 0  # Number of positions in _repetitions that occurred at least twice
 
         if fen is None:
             self.clear()
@@ -1786,6 +1940,14 @@ class Board(BaseBoard):
         self.move_stack.clear()
         self._stack.clear()
 
+        # Every change of the position other than push() and pop() clears
+        # the stack, so the incremental Zobrist hash is computed again and no
+        # position occurred before.
+        self._zobrist_pieces = None
+        if self._repetitions is not None:
+            self._repetitions.clear()
+            self._repeated = 0
+
     def root(self) -> Self:
         """Returns a copy of the root position."""
         if self._stack:
@@ -2218,40 +2380,41 @@ class Board(BaseBoard):
         board occurred for the third time or if such a repetition is reached
         with one of the possible legal moves.
 
-        Note that checking this can be slow: In the worst case
-        scenario, every legal move has to be tested and the entire game has to
-        be replayed because there is no incremental transposition table.
+        The first check replays the move stack once. From then on
+        :func:`~chess.Board.push()` and :func:`~chess.Board.pop()` count
+        positions, so that the check is cheap until some position occurred
+        twice. Then every reversible legal move has to be tested.
         """
-        transposition_key = self._transposition_key()
-        transpositions: Counter[Hashable] = collections.Counter()
-        transpositions.update((transposition_key, ))
-
-        # Count positions.
-        switchyard: List[Move] = []
-        while self.move_stack:
-            move = self.pop()
-            switchyard.append(move)
-
-            if self.is_irreversible(move):
-                break
-
-            transpositions.update((self._transposition_key(), ))
+        repetitions = self._repetitions
+        if repetitions is None:
+            repetitions = self._count_repetitions()
 
-        while switchyard:
-            self.push(switchyard.pop())
+        # Only a position that already occurred twice can occur for the third
+        # time, now or after the next move.
+        if not self._repeated:
+            return False
 
         # Threefold repetition occurred.
-        if transpositions[transposition_key] >= 3:
+        if repetitions[self._transposition_key()] >= 2:
             return True
 
-        # The next legal move is a threefold repetition.
-        for move in self.generate_legal_moves():
-            self.push(move)
-            try:
-                if transpositions[self._transposition_key()] >= 2:
-                    return True
-            finally:
-                self.pop()
+        # The next legal move is a threefold repetition. Irreversible moves
+        # reach a position that never occurred before. The moves are tested
+        # without counting positions, because the position they leave is not
+        # the one they reach.
+        self._repetitions = None
+        try:
+            for move in self.generate_legal_moves():
+                if self.is_irreversible(move):
+                    continue
+                self.push(move)
+                try:
+                    if repetitions[self._transposition_key()] >= 2:
+                        return True
+                finally:
+                    self.pop()
+        finally:
+            self._repetitions = repetitions
 
         return False
 
@@ -2264,10 +2427,19 @@ class Board(BaseBoard):
         this does not consider a repetition that can be played on the next
         move.
 
-        Note that checking this can be slow: In the worst case, the entire
-        game has to be replayed because there is no incremental transposition
-        table.
+        Once :func:`~chess.Board.can_claim_threefold_repetition()` started
+        counting positions, this is a lookup. Otherwise it can be slow: In the
+        worst case, the entire game has to be replayed.
         """
+        if count <= 1:
+            return True
+
+        # Positions counted by push() and pop().
+        if self._repetitions is not None:
+            if count >= 3 and not self._repeated:
+                return False
+            return self._repetitions[self._transposition_key()] + 1 >= count
+
         # Fast check, based on occupancy only.
         maybe_repetitions = 1
         for state in reversed(self._stack):
@@ -2304,6 +2476,36 @@ class Board(BaseBoard):
 
         return False
 
+    def _count_repetitions(self) -> Counter[Hashable]:
+        # Start counting positions in push() and pop(). The move stack is
+        # replayed once to count the positions already on it.
+        switchyard: List[Move] = []
+        while self.move_stack:
+            switchyard.append(self.pop())
+
+        self._repetitions = collections.Counter()
+        self._repeated = 0
+
+        while switchyard:
+            self.push(switchyard.pop())
+
+        return self._repetitions
+
+    def _count_position(self, board_state: _BoardState) -> None:
+        # Some variants test en passant captures by pushing them, which must
+        # not count the position in turn.
+        repetitions = typing.cast(Counter[Hashable], self._repetitions)
+        self._repetitions = None
+        try:
+            transposition_key = self._transposition_key()
+        finally:
+            self._repetitions = repetitions
+        board_state.transposition_key = transposition_key
+        count = repetitions[transposition_key] + 1
+        repetitions[transposition_key] = count
+        if count == 2:
+            self._repeated += 1
+
     def _push_capture(self, move: Move, capture_square: Square, piece_type: PieceType, was_promoted: bool) -> None:
         pass
 
@@ -2333,6 +2535,8 @@ class Board(BaseBoard):
         # Push move and remember board state.
         move = self._to_chess960(move)
         board_state = _BoardState(self)
+        if self._repetitions is not None:
+            self._count_position(board_state)
         self.castling_rights = self.clean_castling_rights()  # Before pushing stack
         self.move_stack.append(self._from_chess960(self.chess960, move.from_square, move.to_square, move.promotion, move.drop))
         self._stack.append(board_state)
@@ -2354,6 +2558,8 @@ class Board(BaseBoard):
         # Drops.
         if move.drop:
             self._set_piece_at(move.to_square, move.drop, self.turn)
+            if self._zobrist_pieces is not None:
+                self._zobrist_push(board_state)
             self.turn = not self.turn
             return
 
@@ -2425,6 +2631,10 @@ class Board(BaseBoard):
             if captured_piece_type:
                 self._push_capture(move, capture_square, captured_piece_type, was_promoted)
 
+        # Update the Zobrist hash of the pieces, if maintained.
+        if self._zobrist_pieces is not None:
+            self._zobrist_push(board_state)
+
         # Swap turn.
         self.turn = not self.turn
 
@@ -2435,7 +2645,18 @@ class Board(BaseBoard):
         :raises: :exc:`IndexError` if the move stack is empty.
         """
         move = self.move_stack.pop()
-        self._stack.pop().restore(self)
+        board_state = self._stack.pop()
+        board_state.restore(self)
+
+        if board_state.transposition_key is not None and self._repetitions is not None:
+            count = self._repetitions[board_state.transposition_key]
+            if count == 2:
+                self._repeated -= 1
+            if count > 1:
+                self._repetitions[board_state.transposition_key] = count - 1
+            else:
+                del self._repetitions[board_state.transposition_key]
+
         return move
 
     def peek(self) -> Move:
@@ -3794,6 +4015,88 @@ class Board(BaseBoard):
 
         return move
 
+    @property
+    def zobrist(self) -> int:
+        """
+        The 64-bit Polyglot Zobrist hash of the position, equal to
+        :func:`chess.polyglot.zobrist_hash()`.
+
+        Reading the hash starts maintaining the hash of the pieces
+        incrementally in :func:`~chess.Board.push()` and
+        :func:`~chess.Board.pop()`, so that it is cheap to read after every
+        move. Boards that never read it do not pay for the updates.
+        """
+        zobrist_hash = self._zobrist_pieces
+        if zobrist_hash is None:
+            zobrist_hash = self._zobrist_pieces = self._zobrist_board()
+        array = _zobrist_array()
+
+        # Castling flags, like has_kingside_castling_rights() and
+        # has_queenside_castling_rights(), which depend on nothing but the
+        # castling rights and the kings on the backranks.
+        castling_rights = self.clean_castling_rights()
+        if castling_rights:
+            kings = self.kings & ~self.promoted & ((self.occupied_co[WHITE] & BB_RANK_1) | (self.occupied_co[BLACK] & BB_RANK_8))
+            castling_key = castling_rights | (kings << 64)
+            castling_hash = _ZOBRIST_CASTLING.get(castling_key)
+            if castling_hash is None:
+                castling_hash = 0
+                for backrank, offset in [(BB_RANK_1, 768), (BB_RANK_8, 770)]:
+                    king_mask = kings & backrank
+                    rooks = castling_rights & backrank
+                    if king_mask and any(BB_SQUARES[rook] > king_mask for rook in scan_forward(rooks)):
+                        castling_hash ^= array[offset]
+                    if king_mask and any(BB_SQUARES[rook] < king_mask for rook in scan_forward(rooks)):
+                        castling_hash ^= array[offset + 1]
+                _ZOBRIST_CASTLING[castling_key] = castling_hash
+            zobrist_hash ^= castling_hash
+
+        # Polyglot hashes the en passant file if a pawn is ready to capture,
+        # whether or not the capture is legal.
+        if self.ep_square:
+            ep_mask = shift_down(BB_SQUARES[self.ep_square]) if self.turn == WHITE else shift_up(BB_SQUARES[self.ep_square])
+            if (shift_left(ep_mask) | shift_right(ep_mask)) & self.pawns & self.occupied_co[self.turn]:
+                zobrist_hash ^= array[772 + square_file(self.ep_square)]
+
+        if self.turn == WHITE:
+            zobrist_hash ^= array[780]
+
+        return zobrist_hash
+
+    def _zobrist_board(self) -> int:
+        array = _zobrist_array()
+        zobrist_hash = 0
+        for pivot, squares in enumerate(self.occupied_co):
+            for square in scan_reversed(squares):
+                piece_index = (typing.cast(PieceType, self.piece_type_at(square)) - 1) * 2 + pivot
+                zobrist_hash ^= array[64 * piece_index + square]
+        return zobrist_hash
+
+    def _zobrist_push(self, board_state: _BoardState) -> None:
+        # Update the hash of the pieces with the squares that changed since
+        # board_state, by piece type and color. A promotion capturing a piece
+        # of the promoted type changes colors without changing the bitboard.
+        array = _zobrist_array()
+        zobrist_hash = typing.cast(int, self._zobrist_pieces)
+        occupied_w = self.occupied_co[WHITE]
+        occupied_b = self.occupied_co[BLACK]
+        for offset, before, after in [
+                (0, board_state.pawns, self.pawns),
+                (128, board_state.knights, self.knights),
+                (256, board_state.bishops, self.bishops),
+                (384, board_state.rooks, self.rooks),
+                (512, board_state.queens, self.queens),
+                (640, board_state.kings, self.kings)]:
+            changed_b = (before & board_state.occupied_b) ^ (after & occupied_b)
+            if changed_b:
+                for square in scan_forward(changed_b):
+                    zobrist_hash ^= array[offset + square]
+            changed_w = (before & board_state.occupied_w) ^ (after & occupied_w)
+            if changed_w:
+                for square in scan_forward(changed_w):
+                    zobrist_hash ^= array[offset + 64 + square]
+        self._zobrist_pieces = zobrist_hash
+
     def _transposition_key(self) -> Hashable:
         return (self.pawns, self.knights, self.bishops, self.rooks,
                 self.queens, self.kings,
@@ -3817,6 +4120,11 @@ class Board(BaseBoard):
 
     def __eq__(self, board: object) -> bool:
         if isinstance(board, Board):
+            # Boards that maintain the Zobrist hash of their pieces can only be
+            # equal if those hashes are.
+            if self._zobrist_pieces is not None and board._zobrist_pieces is not None and self._zobrist_pieces != board._zobrist_pieces:
+                return False
+
             return (
                 self.halfmove_clock == board.halfmove_clock and
                 self.fullmove_number == board.fullmove_number and
@@ -3871,12 +4179,17 @@ class Board(BaseBoard):
         board.turn = self.turn
         board.fullmove_number = self.fullmove_number
         board.halfmove_clock = self.halfmove_clock
+        board._zobrist_pieces = self._zobrist_pieces
 
         if stack:
             stack = len(self.move_stack) if stack is True else stack
             board.move_stack = [copy.copy(move) for move in self.move_stack[-stack:]]
             board._stack = self._stack[-stack:]
 
+        if self._repetitions is not None:
+            board._repetitions = collections.Counter(state.transposition_key for state in board._stack if state.transposition_key is not None)
+            board._repeated = sum(1 for count in board._repetitions.values() if count >= 2)
+
         return board
 
     @classmethod
@@ -3956,6 +4269,73 @@ class LegalMoveGenerator:
         return f"<LegalMoveGenerator at {id(self):#x} ({sans})>"
 
 
+def _perft_board(board: BoardT) -> BoardT:
+    # A copy without move stack, that maintains neither the Zobrist hash nor
+    # the repetition counts in push().
+    board = board.copy(stack=False)
+    board._zobrist_pieces = None
+    board._repetitions = None
+    return board
+
+def _perft(board: Board, depth: int) -> int:
+    if depth <= 1:
+        # Bulk counting: the moves of the last ply are counted, not played.
+        return len(list(board.generate_legal_moves())) if depth == 1 else 1
+
+    nodes = 0
+    for move in board.generate_legal_moves():
+        board.push(move)
+        nodes += _perft(board, depth - 1)
+        board.pop()
+    return nodes
+
+def perft(board: Board, depth: int) -> int:
+    """
+    Counts the positions at the end of every sequence of *depth* legal moves
+    from *board*, to test and benchmark move generation.
+
+    The moves are played on a copy of the board.
+
+    >>> import chess
+    >>>
+    >>> chess.perft(chess.Board(), 3)
+    8902
+
+    :raises: :exc:`ValueError` if *depth* is negative.
+    """
+    if depth < 0:
+        raise ValueError(f"perft needs a depth of at least 0, got {depth}")
+
+    return _perft(_perft_board(board), depth)
+
+def divide(board: Board, depth: int) -> Dict[Move, int]:
+    """
+    Like :func:`~chess.perft()`, but counts the positions below each legal
+    move separately, to find the move under which a count goes wrong. At
+    depth 0 no move is played, so there is nothing to count.
+
+    >>> import chess
+    >>>
+    >>> chess.divide(chess.Board(), 3)[chess.Move.from_uci("e2e4")]
+    600
+
+    :raises: :exc:`ValueError` if *depth* is negative.
+    """
+    if depth < 0:
+        raise ValueError(f"divide needs a depth of at least 0, got {depth}")
+
+    nodes: Dict[Move, int] = {}
+    if depth == 0:
+        return nodes
+
+    board = _perft_board(board)
+    for move in board.generate_legal_moves():
+        board.push(move)
+        nodes[move] = _perft(board, depth - 1)
+        board.pop()
+    return nodes
+
+
 IntoSquareSet: TypeAlias = Union[SupportsInt, Iterable[Square]]
 
 class SquareSet:
@@ -0,0 +1,61 @@
+# Chess.com replay ETL: downloads games from chess.com and converts them into the Command: streams that
+# the C# replay tests play back. Importing the package has no side effects; see cli.main for the script.
+#
+# The names below are imported from their submodule on first access, so that `import replay_etl.converter`,
+# e.g. in a conversion worker process, does not also load requests, sqlite3 and the benchmarks.
+import importlib
+
+_EXPORTS = {
+    "benchmark_suite": "bench",
+    "run_benchmarks": "bench",
+    "build_book": "book",
+    "Checkpoint": "checkpoint",
+    "CONVERTER_VERSION": "converter",
+    "PieceTracker": "converter",
+    "ReplayCommandVisitor": "converter",
+    "convert_game": "converter",
+    "convert_pgn_file": "converter",
+    "iter_converted_games": "converter",
+    "read_converted_game": "converter",
+    "generate_corpus": "corpus",
+    "generate_game": "corpus",
+    "GameDatabase": "database",
+    "query_games": "database",
+    "ArchiveCache": "fetch",
+    "PgnDirectorySink": "fetch",
+    "TokenBucket": "fetch",
+    "fetch_archives": "fetch",
+    "month_range": "fetch",
+    "GameFilter": "filters",
+    "load_game_filter": "filters",
+    "benchmark_import": "importbench",
+    "perft_benchmark": "perftbench",
+    "run_perft": "perftbench",
+    "StreamingConversionSink": "pipeline",
+    "check_converted_corpus": "pipeline",
+    "convert_directory": "pipeline",
+    "PositionIndex": "positions",
+    "build_position_index": "positions",
+    "balance_shards": "shards",
+    "write_shard_manifest": "shards",
+    "MagicBoard": "sliderbench",
+    "benchmark_sliders": "sliderbench",
+    "RunStats": "stats",
+    "SegmentStore": "store",
+    "export_store": "store",
+    "load_config": "util",
+    "verify_corpus": "verify",
+    "verify_game": "verify",
+}
+
+__all__ = sorted(_EXPORTS)
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{_EXPORTS[name]}"), name)
+    globals()[name] = value  # Later lookups no longer go through __getattr__
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
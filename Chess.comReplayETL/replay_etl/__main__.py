@@ -0,0 +1,4 @@
+if __name__ == "__main__":
+    # Guarded because worker processes re-import this module as __mp_main__
+    from replay_etl.cli import main
+    main()
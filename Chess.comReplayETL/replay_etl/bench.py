@@ -0,0 +1,249 @@
+# Benchmark suite: games/sec, peak RSS and allocations of parsing, conversion and whole-file runs, compared
+# against a JSON baseline so that slowdowns of the converter or the vendored chess package are caught
+import io
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import chess.pgn
+
+from replay_etl.converter import PieceTracker, append_outcome, convert_move, convert_pgn_file
+from replay_etl.corpus import generate_corpus
+from replay_etl.util import write_json_atomic
+
+try:
+    import resource  # Not available on Windows, where peak RSS is not reported
+except ImportError:
+    resource = None
+
+# What each mode measures:
+#   parse   - chess.pgn parsing every move of every game, without converting
+#   convert - converting games whose moves were parsed beforehand
+#   end_to_end - convert_pgn_file: reading the PGN file, parsing, converting and writing the output
+MODES = ("parse", "convert", "end_to_end")
+
+# A run over a small corpus takes a few milliseconds, where timer and scheduler noise alone exceed the
+# regression threshold, so every timing sample repeats the run for at least this long
+MIN_SAMPLE_SECONDS = 0.2
+
+# Parses every move like the converter does, without building a game tree or converting anything
+class ParseOnlyVisitor(chess.pgn.BaseVisitor):
+    def begin_variation(self):
+        return chess.pgn.SKIP
+
+    def result(self):
+        return True
+
+def load_contents(pgn_filepaths):
+    contents = []
+    for pgn_filepath in pgn_filepaths:
+        with open(pgn_filepath) as pgn_file:
+            contents.append(pgn_file.read())
+    return contents
+
+# Parse the games up front for the convert mode: (starting board, mainline moves, Result header)
+def parse_games(contents):
+    games = []
+    for content in contents:
+        text = io.StringIO(content)
+        while True:
+            game = chess.pgn.read_game(text)
+            if game is None:
+                break
+            games.append((game.board(), list(game.mainline_moves()), game.headers.get("Result", "Unknown")))
+    return games
+
+# Each run returns the number of games it went through, which games/sec is computed from
+def run_parse(contents):
+    parsed = 0
+    for content in contents:
+        text = io.StringIO(content)
+        while chess.pgn.read_game(text, Visitor=ParseOnlyVisitor) is not None:
+            parsed += 1
+    return parsed
+
+def run_convert(games):
+    for starting_board, moves, result in games:
+        board = starting_board.copy()
+        tracker = PieceTracker(board)
+        converted_moves = []
+        for move in moves:
+            convert_move(tracker, board, move, converted_moves)
+            board.push(move)
+        append_outcome(board, result, converted_moves)
+    return len(games)
+
+def run_end_to_end(pgn_filepaths, output_directory):
+    converted = 0
+    for pgn_filepath in pgn_filepaths:
+        output_filepath = os.path.join(output_directory, "converted_" + os.path.basename(pgn_filepath))
+        converted += len(convert_pgn_file(pgn_filepath, output_filepath))
+    return converted
+
+# Seconds per run: the median of repeat samples, each of which loops the run for at least MIN_SAMPLE_SECONDS.
+# Returns it with the number of runs per sample.
+def time_runs(run, repeat):
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SAMPLE_SECONDS:
+            break
+        loops *= 2
+
+    samples = [elapsed / loops]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        samples.append((time.perf_counter() - start) / loops)
+    return statistics.median(samples), loops
+
+# Worker entry point, run in a fresh process per mode so that peak RSS belongs to that mode alone.
+# Returns the median time of repeat samples and the number of games of a run, plus the peak traced memory of one
+# extra run and the memory blocks still allocated after it (a growing number points at a leak, e.g. a cache that is never cleared).
+def measure_mode(job):
+    mode, pgn_filepaths, repeat = job
+    with tempfile.TemporaryDirectory() as output_directory:
+        if mode == "parse":
+            contents = load_contents(pgn_filepaths)
+            run = lambda: run_parse(contents)
+        elif mode == "convert":
+            games = parse_games(load_contents(pgn_filepaths))
+            run = lambda: run_convert(games)
+        else:
+            run = lambda: run_end_to_end(pgn_filepaths, output_directory)
+
+        seconds, loops = time_runs(run, repeat)
+
+        # tracemalloc slows everything down, so allocations are measured on a separate run
+        tracemalloc.start()
+        blocks_before = sys.getallocatedblocks()
+        counted_games = run()
+        peak_traced_bytes = tracemalloc.get_traced_memory()[1]
+        retained_blocks = sys.getallocatedblocks() - blocks_before
+        tracemalloc.stop()
+
+    peak_rss_kb = None
+    if resource is not None:
+        peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == "darwin":
+            peak_rss_kb //= 1024  # bytes on macOS, kilobytes elsewhere
+    return {
+        "seconds": round(seconds, 6),
+        "games": counted_games,
+        "games_per_second": round(counted_games / seconds, 3) if seconds else None,
+        "runs_per_sample": loops,
+        "peak_rss_kb": peak_rss_kb,
+        "peak_traced_bytes": peak_traced_bytes,
+        "retained_blocks": retained_blocks,
+    }
+
+def list_pgn_files(pgn_directory):
+    return [os.path.join(pgn_directory, filename) for filename in sorted(os.listdir(pgn_directory)) if filename.endswith(".pgn")]
+
+# The generated corpus is kept in corpus_directory and only generated again when its size or seed changes
+def generated_corpus_files(corpus_directory, size, seed, workers=1):
+    pgn_directory = os.path.join(corpus_directory, f"seed{seed}_{size}")
+    if not os.path.isdir(pgn_directory) or len(list_pgn_files(pgn_directory)) != size:
+        generate_corpus(pgn_directory, size, seed=seed, workers=workers)
+    return list_pgn_files(pgn_directory)
+
+# spawn gives every measurement a fresh interpreter, so its peak RSS is not inherited from this process
+def measure_in_new_process(mode, pgn_filepaths, repeat):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(measure_mode, (mode, pgn_filepaths, repeat)).result()
+
+def print_measurement(name, mode, measured):
+    rss = f"{measured['peak_rss_kb'] / 1024:.1f} MiB" if measured["peak_rss_kb"] is not None else "n/a"
+    print(f"{name:>10} {mode:>10}: {measured['games_per_second']:10.1f} games/sec, peak RSS {rss}, "
+          f"peak traced {measured['peak_traced_bytes'] / 1024 / 1024:.1f} MiB")
+
+# Run every mode over every corpus. corpora maps a corpus name to its PGN files.
+def run_benchmarks(corpora, repeat=5):
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpora": {},
+    }
+    for name, pgn_filepaths in corpora.items():
+        modes = {}
+        for mode in MODES:
+            modes[mode] = measure_in_new_process(mode, pgn_filepaths, repeat)
+            print_measurement(name, mode, modes[mode])
+        results["corpora"][name] = {"files": len(pgn_filepaths), "games": modes["parse"]["games"], "modes": modes}
+    return results
+
+# The (corpus, mode, games/sec, baseline games/sec, change in percent) of every mode slower than threshold_percent
+def slower_modes(results, baseline, threshold_percent):
+    slower = []
+    for name, corpus in results["corpora"].items():
+        baseline_corpus = baseline.get("corpora", {}).get(name)
+        # Throughput is only comparable on a corpus of the same size
+        if baseline_corpus is None or baseline_corpus["games"] != corpus["games"]:
+            continue
+        for mode, measured in corpus["modes"].items():
+            expected = baseline_corpus["modes"].get(mode, {}).get("games_per_second")
+            if not expected or not measured["games_per_second"]:
+                continue
+            change = (measured["games_per_second"] - expected) / expected * 100
+            if change < -threshold_percent:
+                slower.append((name, mode, measured["games_per_second"], expected, change))
+    return slower
+
+# Compare games/sec against the baseline. Returns the regressions slower than threshold_percent.
+def find_regressions(results, baseline, threshold_percent):
+    return [f"{name} {mode}: {measured:.1f} games/sec is {-change:.1f}% below the baseline of {expected:.1f}"
+            for name, mode, measured, expected, change in slower_modes(results, baseline, threshold_percent)]
+
+def save_baseline(baseline_path, results):
+    write_json_atomic(baseline_path, results)
+    print(f"Saved the benchmark baseline to {baseline_path}")
+
+# Benchmark the checked-in corpus and, with generated_size, a generated one. The results are written to
+# results_path; with save they become the new baseline, otherwise they are compared with the baseline and
+# every mode that looks slower is measured once more.
+# Returns the regressions found.
+def benchmark_suite(pgn_directory, results_path, baseline_path, threshold_percent=25, generated_size=0,
+                    corpus_directory="benchmark_corpus", seed=0, save=False, workers=1, repeat=5):
+    corpora = {"checked_in": list_pgn_files(pgn_directory)}
+    if generated_size:
+        corpora["generated"] = generated_corpus_files(corpus_directory, generated_size, seed, workers)
+    results = run_benchmarks(corpora, repeat)
+
+    if save:
+        write_json_atomic(results_path, results)
+        save_baseline(baseline_path, results)
+        return []
+    if not os.path.exists(baseline_path):
+        write_json_atomic(results_path, results)
+        print(f"No baseline at {baseline_path}; run with --save-baseline to create one")
+        return []
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+
+    # A machine that is briefly busy slows down a whole mode, so a mode only counts as slower if a second
+    # measurement in a new process confirms it. The faster of the two measurements is kept.
+    for name, mode, _, _, _ in slower_modes(results, baseline, threshold_percent):
+        print(f"{name} {mode} is slower than the baseline, measuring it again...")
+        measured = measure_in_new_process(mode, corpora[name], repeat)
+        print_measurement(name, mode, measured)
+        modes = results["corpora"][name]["modes"]
+        if measured["games_per_second"] > modes[mode]["games_per_second"]:
+            modes[mode] = measured
+    write_json_atomic(results_path, results)
+
+    regressions = find_regressions(results, baseline, threshold_percent)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    print(f"{len(regressions)} modes more than {threshold_percent}% slower than the baseline")
+    return regressions
@@ -0,0 +1,123 @@
+# Polyglot opening book writer: aggregates the moves of the PGN corpus into a .bin book that
+# chess.polyglot.open_reader serves (find_all, weighted_choice)
+import itertools
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+import chess
+import chess.pgn
+import chess.polyglot
+
+from replay_etl.extsort import drain_records, iter_sorted, spill_directory, spill_records
+
+# One played move: (Zobrist key, Polyglot move, outcome for the side that played it), big-endian so
+# that the records of a position sort together and the moves of a position sort together
+MOVE_STRUCT = struct.Struct(">QHB")
+LOSS, DRAW, WIN = 0, 1, 2
+
+# How a move is weighted:
+#   score     - 2 per win and 1 per draw of the side that played it, like Polyglot's own book builder;
+#               moves that only lost get weight 0 and are never played
+#   frequency - the number of games it was played in
+WEIGHTS = ("score", "frequency")
+
+# Polyglot encodes castling as the king moving onto its own rook, and promotions as 1 (knight) to 4 (queen)
+def polyglot_move(board, move):
+    to_square = move.to_square
+    if board.is_castling(move):
+        rook_file = 7 if board.is_kingside_castling(move) else 0
+        to_square = chess.square(rook_file, chess.square_rank(move.from_square))
+    promotion = move.promotion - 1 if move.promotion else 0
+    return to_square | (move.from_square << 6) | (promotion << 12)
+
+# The packed move records of every game of a PGN file, one move at a time. With players, only the moves
+# of those players are recorded.
+def book_moves(pgn_filepath, max_ply, players):
+    with open(pgn_filepath) as pgn_file:
+        while True:
+            game = chess.pgn.read_game(pgn_file)
+            if game is None:
+                break
+            result = game.headers.get("Result")
+            board = game.board()
+            # Polyglot books only describe standard chess
+            if result not in ("1-0", "0-1", "1/2-1/2") or board.chess960 or type(board) is not chess.Board:
+                continue
+            sides = {color for color, name in ((chess.WHITE, game.headers.get("White", "")), (chess.BLACK, game.headers.get("Black", "")))
+                     if players is None or name.lower() in players}
+            for ply, move in enumerate(game.mainline_moves()):
+                if max_ply is not None and ply >= max_ply:
+                    break
+                if board.turn in sides:
+                    if result == "1/2-1/2":
+                        outcome = DRAW
+                    else:
+                        outcome = WIN if (result == "1-0") == (board.turn == chess.WHITE) else LOSS
+                    yield MOVE_STRUCT.pack(board.zobrist, polyglot_move(board, move), outcome)
+                board.push(move)
+
+# Worker entry point: spill the move records of a PGN file and return the spilled file. job is
+# (pgn file, max ply, players, spill directory).
+def spill_book_moves(job):
+    pgn_filepath, max_ply, players, directory = job
+    return spill_records(book_moves(pgn_filepath, max_ply, players), directory)
+
+# Book entries of one position from its sorted move records. Weights are scaled down when the largest
+# one does not fit the 16 bits of a Polyglot weight, and the entries are ordered by weight like Polyglot does.
+def position_entries(key, moves, weights, min_games):
+    weighted = []
+    for raw_move, (wins, draws, losses) in moves.items():
+        if wins + draws + losses < min_games:
+            continue
+        weight = 2 * wins + draws if weights == "score" else wins + draws + losses
+        if weight > 0:
+            weighted.append((weight, raw_move))
+    if not weighted:
+        return []
+    largest = max(weight for weight, _ in weighted)
+    scale = 0xffff / largest if largest > 0xffff else 1
+    weighted.sort(key=lambda entry: (-entry[0], entry[1]))
+    return [chess.polyglot.ENTRY_STRUCT.pack(key, raw_move, max(1, int(weight * scale)), 0) for weight, raw_move in weighted]
+
+# Build a Polyglot book from every game in the PGN directory. The move records go through an external
+# sort, and worker processes spill theirs to temporary files, so memory use stays bounded by chunk_records
+# however many games there are; only the moves of one position are aggregated at a time. Returns the number of entries written.
+def build_book(pgn_directory, book_path, weights="score", min_games=1, max_ply=None, players=None, workers=1,
+               chunk_records=1000000):
+    if weights not in WEIGHTS:
+        raise ValueError(f"Unknown book weights {weights!r}, expected one of {', '.join(WEIGHTS)}")
+    players = {player.lower() for player in players} if players else None
+    jobs = [(os.path.join(pgn_directory, filename), max_ply, players)
+            for filename in sorted(os.listdir(pgn_directory)) if filename.endswith(".pgn")]
+
+    def write_book(results):
+        entries = positions = 0
+        with open(temp_path, "wb") as book_file:
+            sorted_records = iter_sorted(itertools.chain.from_iterable(results), MOVE_STRUCT.size, chunk_records, directory or None)
+            # The first 8 bytes of a record are its position key
+            for key_bytes, position_records in itertools.groupby(sorted_records, key=lambda record: record[:8]):
+                moves = {}
+                for record in position_records:
+                    _, raw_move, outcome = MOVE_STRUCT.unpack(record)
+                    moves.setdefault(raw_move, [0, 0, 0])[(WIN, DRAW, LOSS).index(outcome)] += 1
+                written = position_entries(int.from_bytes(key_bytes, "big"), moves, weights, min_games)
+                book_file.writelines(written)
+                entries += len(written)
+                positions += bool(written)
+        os.replace(temp_path, book_path)
+        return entries, positions
+
+    directory = os.path.dirname(book_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = book_path + ".tmp"
+    if workers > 1 and len(jobs) > 1:
+        with spill_directory(directory or None) as spill_path, ProcessPoolExecutor(max_workers=workers) as executor:
+            spill_jobs = [job + (spill_path,) for job in jobs]
+            paths = executor.map(spill_book_moves, spill_jobs, chunksize=max(1, len(jobs) // (workers * 4)))
+            entries, positions = write_book(drain_records(path, MOVE_STRUCT.size) for path in paths)
+    else:
+        entries, positions = write_book(book_moves(*job) for job in jobs)
+    print(f"Wrote {entries} book entries for {positions} positions from {len(jobs)} files to {book_path}")
+    return entries
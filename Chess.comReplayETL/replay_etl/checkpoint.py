@@ -0,0 +1,110 @@
+# Checkpoints of a long run: which archives were fetched and which games were converted, so that an
+# interrupted backfill can be continued with --resume instead of starting over
+import json
+import logging
+import os
+import time
+
+from replay_etl.util import write_json_atomic
+
+LOGGER = logging.getLogger(__name__)
+
+# Progress record of one run. The stages report their progress to it and register hooks that persist their
+# own state (the conversion manifest, the HTTP cache index, the stores); a checkpoint runs every hook first
+# and only then writes the checkpoint file, so the file never claims more than what is on disk.
+class Checkpoint:
+    # arguments identifies the run; a checkpoint of a run with other arguments is not resumed
+    def __init__(self, path, arguments, resume=False, interval_seconds=30.0):
+        self.path = path
+        # Round-tripped through JSON so that e.g. tuples compare equal to the lists loaded from the file
+        self.arguments = json.loads(json.dumps(arguments))
+        self.interval_seconds = interval_seconds
+        self.fetched_archives = set()
+        self.converted_games = set()
+        self.hooks = []
+        self.last_saved = time.monotonic()
+
+        if resume and os.path.exists(path):
+            with open(path) as checkpoint_file:
+                data = json.load(checkpoint_file)
+            if data.get("arguments") == self.arguments:
+                self.fetched_archives = set(data.get("fetched_archives", []))
+                self.converted_games = set(data.get("converted_games", []))
+                print(f"Resuming from {path}: {len(self.fetched_archives)} archives fetched, "
+                      f"{len(self.converted_games)} games converted")
+            else:
+                print(f"Checkpoint {path} belongs to a run with other arguments; starting over")
+        elif resume:
+            print(f"No checkpoint at {path}; starting from the beginning")
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def is_fetched(self, url):
+        return url in self.fetched_archives
+
+    def archive_fetched(self, url):
+        self.fetched_archives.add(url)
+        self.maybe_save()
+
+    def is_converted(self, filename):
+        return filename in self.converted_games
+
+    def game_converted(self, filename):
+        self.converted_games.add(filename)
+        self.maybe_save()
+
+    # Save when the interval has passed since the last checkpoint
+    def maybe_save(self):
+        if time.monotonic() - self.last_saved >= self.interval_seconds:
+            self.save()
+
+    def save(self):
+        for hook in self.hooks:
+            hook()
+        write_json_atomic(self.path, {
+            "arguments": self.arguments,
+            "fetched_archives": sorted(self.fetched_archives),
+            "converted_games": sorted(self.converted_games),
+        })
+        self.last_saved = time.monotonic()
+        LOGGER.info("Checkpoint saved to %s", self.path)
+
+    # The run finished, nothing is left to resume
+    def complete(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+# Stand-in for callers that do not checkpoint
+class NullCheckpoint:
+    def add_hook(self, hook):
+        pass
+
+    def remove_hook(self, hook):
+        pass
+
+    def is_fetched(self, url):
+        return False
+
+    def archive_fetched(self, url):
+        pass
+
+    def is_converted(self, filename):
+        return False
+
+    def game_converted(self, filename):
+        pass
+
+    def maybe_save(self):
+        pass
+
+    def save(self):
+        pass
+
+    def complete(self):
+        pass
+
+NULL_CHECKPOINT = NullCheckpoint()
@@ -0,0 +1,352 @@
+# Command line entry point of the ETL
+import argparse
+import os
+
+import chess
+
+from replay_etl.bench import benchmark_suite
+from replay_etl.book import build_book
+from replay_etl.checkpoint import Checkpoint
+from replay_etl.corpus import generate_corpus, parse_size
+from replay_etl.database import GameDatabase, load_pgn_directory, query_games
+from replay_etl.fetch import DEFAULT_API_BASE_URL, PgnDirectorySink, fetch_archives, month_range
+from replay_etl.filters import load_game_filter
+from replay_etl.importbench import benchmark_import
+from replay_etl.perftbench import perft_benchmark
+from replay_etl.pipeline import StreamingConversionSink, benchmark_converters, check_converted_corpus, convert_directory
+from replay_etl.positions import PositionIndex, build_position_index
+from replay_etl.shards import write_shard_manifest
+from replay_etl.sliderbench import benchmark_sliders
+from replay_etl.stats import RunStats
+from replay_etl.store import export_store
+from replay_etl.util import configure_logging, load_config
+from replay_etl.verify import verify_corpus
+
+# skip_api_call converts whatever is already in the pgn directory without contacting chess.com
+def main(argv=None, skip_api_call=False):
+    parser = argparse.ArgumentParser(description="Download chess.com games and convert them into replay commands")
+    parser.add_argument("--offline", action="store_true",
+                        help="convert the PGN files already in the pgn directory without contacting chess.com")
+    parser.add_argument("--workspace", metavar="DIR",
+                        help="keep the pgn, converted_moves and store directories and the manifest, stats and shard "
+                             "files under DIR instead of the paths in the config")
+    parser.add_argument("--generate-corpus", metavar="SIZE", type=parse_size,
+                        help="write SIZE seeded random games (e.g. 10k, 100k, 1M) as chess.com-style PGN files into the "
+                             "pgn directory of --workspace and exit (uses --workers)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="random seed of --generate-corpus and of the --benchmark-suite corpus (default: 0)")
+    parser.add_argument("--games-per-file", type=int, default=1,
+                        help="games per PGN file written by --generate-corpus (default: 1)")
+    parser.add_argument("--users", nargs="+",
+                        help="chess.com usernames to download (default: chess_com_usernames or chess_com_username from the config)")
+    parser.add_argument("--start", metavar="YYYY-MM",
+                        help="first month to download (default: chess_com_start_month, or chess_com_year/chess_com_month)")
+    parser.add_argument("--end", metavar="YYYY-MM",
+                        help="last month to download (default: chess_com_end_month, or the start month)")
+    parser.add_argument("--all-archives", action="store_true",
+                        help="download every month listed in the players' archives instead of a date range")
+    parser.add_argument("--api-base-url",
+                        help=f"base URL of the chess.com API (default: api_base_url from the config, or {DEFAULT_API_BASE_URL})")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="download every archive in full, ignoring the HTTP cache")
+    parser.add_argument("--stream", action="store_true",
+                        help="convert games in memory as they are downloaded instead of converting the pgn directory afterwards")
+    parser.add_argument("--raw-pgn", choices=("files", "archive", "none"),
+                        help="how --stream keeps the raw PGN: one file per game, one file per monthly archive, or not at all "
+                             "(default: raw_pgn from the config, or files)")
+    parser.add_argument("--storage", choices=("files", "store"),
+                        help="keep games as one file each, or append them to the segment store in store_directory "
+                             "(implies --stream; default: storage from the config, or files)")
+    parser.add_argument("--export-store", action="store_true",
+                        help="write every game of the segment store out as pgn/ and converted_moves/ files and exit")
+    parser.add_argument("--database", metavar="PATH",
+                        help="also load every converted game into this SQLite database, indexed by player, date, ECO and "
+                             "result (default: database_path from the config, or no database)")
+    parser.add_argument("--query", action="store_true",
+                        help="list the games of the database matching --player, --eco, --result and the --start/--end "
+                             "months, newest first, and exit")
+    parser.add_argument("--player", help="with --query, games of this player; with --build-book, only this player's moves")
+    parser.add_argument("--eco", help="with --query, games of this ECO code, e.g. B01")
+    parser.add_argument("--result", choices=("win", "loss", "draw", "1-0", "0-1", "1/2-1/2"),
+                        help="with --query, games with this result; win, loss and draw need --player")
+    parser.add_argument("--build-position-index", action="store_true",
+                        help="record the Zobrist key of every position of every game in the pgn directory in "
+                             "position_index_path and exit (uses --workers)")
+    parser.add_argument("--find-position", metavar="FEN",
+                        help="list every game and ply of the position index that reached this position, in any move "
+                             "order, and exit")
+    parser.add_argument("--build-book", metavar="PATH",
+                        help="aggregate the moves of the games in the pgn directory into a Polyglot opening book at PATH "
+                             "and exit (uses --workers)")
+    parser.add_argument("--book-weights", choices=("score", "frequency"),
+                        help="weight book moves by 2 per win and 1 per draw, or by how often they were played "
+                             "(default: book_weights from the config, or score)")
+    parser.add_argument("--book-min-games", type=int, metavar="N",
+                        help="leave out moves played in fewer than N games (default: book_min_games from the config, or 1)")
+    parser.add_argument("--book-max-ply", type=int, metavar="N",
+                        help="only record the first N plies of every game (default: book_max_ply from the config, or 40)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes used to convert PGN files (default: 1)")
+    parser.add_argument("--shards", type=int, metavar="N",
+                        help="after converting, split the converted games into N shards balanced by command count and "
+                             "write them to shard_manifest_path (default: shard_count from the config, or no shards)")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted run from its checkpoint, skipping the archives already fetched and "
+                             "the games already converted")
+    parser.add_argument("--full", action="store_true",
+                        help="convert every PGN file even if the manifest says it is up to date")
+    parser.add_argument("--check", action="store_true",
+                        help="convert in memory and compare against the existing converted files, without writing anything")
+    parser.add_argument("--verify", action="store_true",
+                        help="replay the commands of every converted file on a board, compare them with the PGN moves and "
+                             "its CurrentPosition header, report the first diverging ply and exit (uses --workers)")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="time the tree-based and the streaming converter over the PGN directory and exit")
+    parser.add_argument("--benchmark-import", action="store_true",
+                        help="time import chess in fresh interpreters without and with the attack table cache and exit")
+    parser.add_argument("--benchmark-perft", action="store_true",
+                        help="count the nodes of the standard perft positions with chess.perft, report nodes/sec, "
+                             "compare them with the perft baseline and exit; fails on a wrong node count")
+    parser.add_argument("--benchmark-sliders", action="store_true",
+                        help="compare the dict slider attack tables of the chess package with flat magic bitboard tables, "
+                             "in lookups and in legal move generation over the PGN directory, and exit")
+    parser.add_argument("--benchmark-suite", action="store_true",
+                        help="measure games/sec, peak RSS and allocations of parsing, conversion and whole-file runs over "
+                             "the checked-in and a generated corpus, compare them with the baseline and exit")
+    parser.add_argument("--benchmark-size", metavar="SIZE", type=parse_size,
+                        help="games in the generated corpus of --benchmark-suite, 0 for none "
+                             "(default: benchmark_corpus_size from the config, or 2000)")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store the --benchmark-suite or --benchmark-perft results as the new baseline instead of "
+                             "comparing with it")
+    parser.add_argument("--regression-threshold", type=float, metavar="PERCENT",
+                        help="fail --benchmark-suite or --benchmark-perft when a mode or position is this much slower "
+                             "than the baseline (default: benchmark_regression_percent from the config, or 25)")
+    parser.add_argument("--log-level", choices=("DEBUG", "INFO", "WARNING", "ERROR"),
+                        help="show log messages of this level and above (default: log_level from the config, or WARNING)")
+    parser.add_argument("--stats", metavar="PATH",
+                        help="write per-stage timings and counters of the run as JSON to PATH, or - for stdout "
+                             "(default: stats_path from the config, or etl_stats.json)")
+    args = parser.parse_args(argv)
+
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.shards is not None and args.shards < 1:
+        parser.error("--shards must be at least 1")
+    if args.generate_corpus is not None and not args.workspace:
+        parser.error("--generate-corpus needs --workspace, so generated games never mix with downloaded ones")
+    if args.games_per_file < 1:
+        parser.error("--games-per-file must be at least 1")
+    if args.result in ("win", "loss", "draw") and not args.player:
+        parser.error(f"--result {args.result} needs --player")
+    skip_api_call = skip_api_call or args.offline
+
+    config = load_config()
+
+    # Extract config values
+    pgn_directory = config["pgn_directory"]
+    converted_moves_directory = config["converted_moves_directory"]
+    usernames = args.users or config.get("chess_com_usernames") or [config["chess_com_username"]]
+    year = config["chess_com_year"]
+    month = config["chess_com_month"]
+    base_url = (args.api_base_url or config.get("api_base_url", DEFAULT_API_BASE_URL)).rstrip("/")
+    fetch_concurrency = config.get("fetch_concurrency", 4)
+    fetch_rate_limit = config.get("fetch_rate_limit", 5.0)
+    storage = args.storage or config.get("storage", "files")
+    store_directory = config.get("store_directory", "store")
+    stream = args.stream or config.get("stream_conversion", False) or storage == "store"
+    raw_pgn = args.raw_pgn or config.get("raw_pgn", "files")
+    http_cache_directory = None if args.no_cache else config.get("http_cache_directory", "http_cache")
+    manifest_path = config.get("manifest_path", "etl_manifest.json")
+    game_filter = load_game_filter(config)
+    stats_path = args.stats or config.get("stats_path", "etl_stats.json")
+    shard_count = args.shards or config.get("shard_count", 0)
+    shard_manifest_path = config.get("shard_manifest_path", "etl_shards.json")
+    checkpoint_path = config.get("checkpoint_path", "etl_checkpoint.json")
+    checkpoint_interval = config.get("checkpoint_interval_seconds", 30)
+    database_path = args.database or config.get("database_path")
+    position_index_path = config.get("position_index_path", "etl_positions.idx")
+    if args.workspace:
+        pgn_directory = os.path.join(args.workspace, "pgn")
+        converted_moves_directory = os.path.join(args.workspace, "converted_moves")
+        store_directory = os.path.join(args.workspace, "store")
+        manifest_path = os.path.join(args.workspace, "etl_manifest.json")
+        shard_manifest_path = os.path.join(args.workspace, "etl_shards.json")
+        checkpoint_path = os.path.join(args.workspace, "etl_checkpoint.json")
+        position_index_path = os.path.join(args.workspace, "etl_positions.idx")
+        if database_path and not args.database:
+            database_path = os.path.join(args.workspace, "etl_games.sqlite3")
+        if not args.stats:
+            stats_path = os.path.join(args.workspace, "etl_stats.json")
+
+    configure_logging(args.log_level or config.get("log_level", "WARNING"))
+
+    if args.generate_corpus is not None:
+        generate_corpus(pgn_directory, args.generate_corpus, seed=args.seed, games_per_file=args.games_per_file,
+                        workers=args.workers)
+        return
+
+    if args.benchmark:
+        benchmark_converters(pgn_directory)
+        return
+
+    if args.benchmark_import:
+        benchmark_import()
+        return
+
+    if args.benchmark_perft:
+        threshold = args.regression_threshold
+        if threshold is None:
+            threshold = config.get("benchmark_regression_percent", 25)
+        failures = perft_benchmark(config.get("perft_results_path", "etl_perft.json"),
+                                   config.get("perft_baseline_path", "etl_perft_baseline.json"),
+                                   threshold_percent=threshold, save=args.save_baseline)
+        if failures:
+            exit(1)
+        return
+
+    if args.benchmark_sliders:
+        benchmark_sliders(pgn_directory)
+        return
+
+    if args.benchmark_suite:
+        threshold = args.regression_threshold
+        if threshold is None:
+            threshold = config.get("benchmark_regression_percent", 25)
+        size = args.benchmark_size
+        if size is None:
+            size = config.get("benchmark_corpus_size", 2000)
+        regressions = benchmark_suite(pgn_directory, config.get("benchmark_results_path", "etl_benchmark.json"),
+                                      config.get("benchmark_baseline_path", "etl_benchmark_baseline.json"),
+                                      threshold_percent=threshold, generated_size=size,
+                                      corpus_directory=config.get("benchmark_corpus_directory", "benchmark_corpus"),
+                                      seed=args.seed, save=args.save_baseline, workers=args.workers)
+        if regressions:
+            exit(1)
+        return
+
+    if args.export_store:
+        export_store(store_directory, pgn_directory, converted_moves_directory)
+        return
+
+    if args.query:
+        if not database_path or not os.path.exists(database_path):
+            parser.error("--query needs an existing database (--database or database_path in the config)")
+        # Dates compare as strings, so the 31st is an upper bound of every month
+        games = query_games(database_path, player=args.player, eco=args.eco, result=args.result,
+                            date_from=f"{args.start}-01" if args.start else None,
+                            date_to=f"{args.end or args.start}-31" if args.end or args.start else None)
+        for game in games:
+            print(f"{game['game_id']}\t{game['date']}\t{game['white']}\t{game['black']}\t{game['eco']}\t{game['result']}\t{game['ply_count']}")
+        print(f"{len(games)} games")
+        return
+
+    if args.build_position_index:
+        build_position_index(pgn_directory, position_index_path, workers=args.workers)
+        return
+
+    if args.build_book:
+        # Without --player the book covers the players of book_players, or everyone when that is null
+        players = [args.player] if args.player else config.get("book_players")
+        build_book(pgn_directory, args.build_book, weights=args.book_weights or config.get("book_weights", "score"),
+                   min_games=args.book_min_games or config.get("book_min_games", 1),
+                   max_ply=args.book_max_ply or config.get("book_max_ply", 40), players=players, workers=args.workers)
+        return
+
+    if args.find_position:
+        try:
+            board = chess.Board(args.find_position)
+        except ValueError as error:
+            parser.error(f"--find-position: {error}")
+        with PositionIndex(position_index_path) as index:
+            matches = index.find(board)
+        for game_id, ply in matches:
+            print(f"{game_id}\tply {ply}")
+        print(f"{len(matches)} plies in {len(set(game_id for game_id, _ in matches))} games")
+        return
+
+    if args.check:
+        if check_converted_corpus(pgn_directory, converted_moves_directory):
+            exit(1)
+        return
+
+    if args.verify:
+        if verify_corpus(pgn_directory, converted_moves_directory, workers=args.workers):
+            exit(1)
+        return
+
+    # Ensure directories exist
+    os.makedirs(pgn_directory, exist_ok=True)
+    os.makedirs(converted_moves_directory, exist_ok=True)
+
+    if args.all_archives or config.get("discover_archives", False):
+        months = None
+    else:
+        start = args.start or config.get("chess_com_start_month") or f"{year}-{month}"
+        months = month_range(start, args.end or config.get("chess_com_end_month") or start)
+
+    # A checkpoint is only resumed by a run with the same arguments
+    checkpoint = Checkpoint(checkpoint_path, {
+        "offline": skip_api_call,
+        "users": usernames,
+        "months": months,
+        "api_base_url": base_url,
+        "stream": stream,
+        "storage": storage,
+        "raw_pgn": raw_pgn,
+        "full": args.full,
+        "pgn_directory": pgn_directory,
+        "converted_moves_directory": converted_moves_directory,
+        "game_filter": game_filter.key(),
+        "database": database_path,
+    }, resume=args.resume, interval_seconds=checkpoint_interval)
+
+    database = GameDatabase(database_path, config.get("database_batch_size", 500)) if database_path else None
+    stats = RunStats()
+    try:
+        if not skip_api_call:
+            if stream:
+                sink = StreamingConversionSink(converted_moves_directory, pgn_directory, raw_pgn=raw_pgn,
+                                               manifest_path=manifest_path, force=args.full,
+                                               store_directory=store_directory if storage == "store" else None,
+                                               stats=stats, checkpoint=checkpoint, database=database)
+            else:
+                sink = PgnDirectorySink(pgn_directory, stats)
+            failed = fetch_archives(usernames, sink, months=months, base_url=base_url,
+                                    concurrency=fetch_concurrency, rate_limit=fetch_rate_limit,
+                                    cache_directory=http_cache_directory, stats=stats, game_filter=game_filter,
+                                    checkpoint=checkpoint)
+            if failed:
+                print(f"Failed to retrieve {len(failed)} archives")
+                exit(-1)
+        else:
+            print("Skipping API Call to chess.com")
+
+        # Every downloaded game is converted already when streaming
+        if skip_api_call or not stream:
+            # Iterate through each PGN file in the directory
+            convert_directory(pgn_directory, converted_moves_directory, workers=args.workers,
+                              manifest_path=manifest_path, force=args.full, stats=stats, checkpoint=checkpoint)
+            if database is not None:
+                with stats.timed("database_load"):
+                    load_pgn_directory(database, pgn_directory)
+            if config.get("verify_after_conversion", False):
+                if verify_corpus(pgn_directory, converted_moves_directory, workers=args.workers):
+                    exit(1)
+
+        if shard_count:
+            if storage == "store":
+                print("Shards are built from converted files; run --export-store first")
+            else:
+                write_shard_manifest(converted_moves_directory, shard_count, shard_manifest_path)
+        checkpoint.complete()
+    except BaseException:
+        # Interrupted, e.g. by Ctrl+C or a failed archive: keep the progress for --resume
+        checkpoint.save()
+        print(f"Progress saved to {checkpoint_path}; run again with --resume to continue")
+        raise
+    finally:
+        if database is not None:
+            database.close()
+        # Written for failed runs as well, so slow or broken stages can be told apart
+        stats.write_report(stats_path)
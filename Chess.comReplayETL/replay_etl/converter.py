@@ -0,0 +1,287 @@
+# Converts a chess.com PGN into the Command: lines understood by the C# replay tests
+import io
+import itertools
+import logging
+import os
+import time
+import chess
+import chess.pgn
+
+from replay_etl.stats import NULL_STATS
+from replay_etl.util import write_text
+
+LOGGER = logging.getLogger(__name__)
+
+# Bump whenever the converted output format changes, so the manifest re-runs every game
+CONVERTER_VERSION = 1
+
+# Labels of the pieces in the starting position, indexed by chess.Square
+STARTING_LABELS = {
+    chess.A1: "WR1", chess.B1: "WK1", chess.C1: "WB1", chess.D1: "WQ1",
+    chess.E1: "WK", chess.F1: "WB2", chess.G1: "WK2", chess.H1: "WR2",
+    chess.A8: "BR1", chess.B8: "BK1", chess.C8: "BB1", chess.D8: "BQ1",
+    chess.E8: "BK", chess.F8: "BB2", chess.G8: "BK2", chess.H8: "BR2",
+}
+for file_index in range(8):
+    STARTING_LABELS[chess.square(file_index, 1)] = f"WP{file_index + 1}"  # Pawns at a2, b2, ..., h2
+    STARTING_LABELS[chess.square(file_index, 6)] = f"BP{file_index + 1}"  # Pawns at a7, b7, ..., h7
+
+# Label letters of promoted pieces (knights share the K with the king, as in the replay engine)
+PROMOTION_LETTERS = {chess.QUEEN: "Q", chess.ROOK: "R", chess.BISHOP: "B", chess.KNIGHT: "K"}
+
+# Piece labels of one game, one slot per square. Each game gets its own instance so that
+# conversions never share state (required for converting several games in parallel).
+class PieceTracker:
+    # Initialize piece tracking based on starting positions
+    def __init__(self, board=None):
+        starting_board = chess.Board()
+        self.labels = [None] * 64
+        for square, label in STARTING_LABELS.items():
+            # Games set up from a FEN only keep the labels of pieces that are still on their home square
+            if board is None or board.piece_at(square) == starting_board.piece_at(square):
+                self.labels[square] = label
+
+        # Promotion ID counters
+        self.promotion_ids = {}
+        for color in chess.COLORS:
+            self.promotion_ids[(color, chess.QUEEN)] = 2
+            self.promotion_ids[(color, chess.ROOK)] = 3
+            self.promotion_ids[(color, chess.BISHOP)] = 3
+            self.promotion_ids[(color, chess.KNIGHT)] = 3
+
+    # Get the identifier of the piece that is about to move
+    def get_piece_label(self, piece, move):
+        return self.labels[move.from_square]
+
+    # Update the piece tracker for a move. Must be called with the board before board.push(move).
+    def update_piece_tracking(self, board, move):
+        labels = self.labels
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug("update_piece_tracking: Updating Piece %s from %s to %s", board.piece_at(move.from_square),
+                         chess.square_name(move.from_square), chess.square_name(move.to_square))
+
+        if board.is_castling(move):
+            # Move both the king and the rook
+            rank = chess.square_rank(move.from_square)
+            if board.is_kingside_castling(move):
+                rook_square, rook_new_square, king_new_square = chess.square(7, rank), chess.square(5, rank), chess.square(6, rank)
+            else:
+                rook_square, rook_new_square, king_new_square = chess.square(0, rank), chess.square(3, rank), chess.square(2, rank)
+            king_label, rook_label = labels[move.from_square], labels[rook_square]
+            labels[move.from_square] = labels[rook_square] = None
+            labels[king_new_square], labels[rook_new_square] = king_label, rook_label
+            return
+
+        if board.is_en_passant(move):
+            # The captured pawn is not on the destination square
+            labels[chess.square(chess.square_file(move.to_square), chess.square_rank(move.from_square))] = None
+
+        if move.promotion:
+            color = board.turn
+            promotion_id = self.promotion_ids[(color, move.promotion)]
+            self.promotion_ids[(color, move.promotion)] = promotion_id + 1
+            labels[move.to_square] = f"{'W' if color == chess.WHITE else 'B'}{PROMOTION_LETTERS[move.promotion]}{promotion_id}"
+            LOGGER.debug("pawn promoted to: %s", labels[move.to_square])
+        else:
+            # A capture simply overwrites the label of the captured piece
+            labels[move.to_square] = labels[move.from_square]
+        labels[move.from_square] = None
+
+# Convert a single move into replay commands. board is the position before the move is played.
+def convert_move(tracker, board, move, converted_moves):
+    piece = board.piece_at(move.from_square)  # Get the piece on the from_square
+    if (piece is None):
+        LOGGER.warning("piece is NoneType from (%d,%d), move in question: %s",
+                       chess.square_rank(move.from_square), chess.square_file(move.from_square), move)
+    if board.is_castling(move):
+        LOGGER.debug("Handling castling")
+        converted_moves.append(f"Original: move: {move}, piece: {piece}, from_square: {move.from_square}, to_square: {move.to_square}")
+
+        # The replay engine castles by moving the king onto its own rook
+        if chess.square_file(move.to_square) == 6:  # Kingside castling
+            LOGGER.debug("Kingside Castling")
+            if piece.color == chess.WHITE:
+                converted_moves.append("Command: WK H1")
+            else:
+                converted_moves.append("Command: BK H8")
+        else:  # Queenside castling
+            LOGGER.debug("Queenside Castling")
+            if piece.color == chess.WHITE:
+                converted_moves.append("Command: WK A1")
+            else:
+                converted_moves.append("Command: BK A8")
+    else:
+
+        from_square = chess.square_name(move.from_square)  # Convert to standard notation (e.g., e2)
+        to_square = chess.square_name(move.to_square)  # Convert to standard notation (e.g., e4)
+
+        # Check if the move is a pawn promotion
+        if move.promotion:
+            promoted_piece = chess.piece_name(move.promotion).capitalize()[0]  # Get the promoted piece name (e.g., "Queen")
+            converted_moves.append(f"Original: move: {move}, piece: {piece}, from_square: {from_square}, to_square: {to_square}, promotion: {promoted_piece}")
+            converted_moves.append(f"Command: {tracker.get_piece_label(piece, move)} {to_square.upper()}")
+            converted_moves.append(f"Command: {promoted_piece.upper()}")
+        else:
+            # Normal move, no promotion
+            piece_name = tracker.get_piece_label(piece, move)  # Get the piece's unique label
+            converted_moves.append(f"Original: move: {move}, piece: {piece}, from_square: {from_square}, to_square: {to_square}, piece_name: {piece_name} ")
+            converted_moves.append(f"Command: {piece_name} {to_square.upper()}")
+
+    tracker.update_piece_tracking(board, move)  # Ensure we track the move (including castling and promotions)
+
+# Append the final state of the game. board is the position after the last move.
+def append_outcome(board, result, converted_moves):
+    if board.is_checkmate():
+        if board.turn:  # If it's White's turn, that means Black delivered checkmate
+            outcome = "Black wins against White by CheckMate!"
+        else:
+            outcome = "White wins against Black by CheckMate!"
+    elif board.is_stalemate():
+        outcome = "Game Ends in Stalemate!"
+    elif result == "1-0":
+        outcome = "White wins against Black by Resignation!"
+        converted_moves.append(f"Command: resign black")
+        converted_moves.append(f"Command: y")
+    elif result == "0-1":
+        outcome = "Black wins against White by Resignation!"
+        converted_moves.append(f"Command: resign white")
+        converted_moves.append(f"Command: y")
+    elif result == "1/2-1/2":
+        outcome = "Game ended in a draw"
+    else:
+        outcome = "Unknown outcome"
+
+    # Append the game outcome to the converted moves
+    converted_moves.append(f"Outcome: {outcome}")
+
+# Tree-based converter: builds the full Game tree with chess.pgn.read_game, then replays
+# the mainline on a second board. Kept as the reference implementation for benchmarks.
+def convert_game_tree(pgn_file):
+    game = chess.pgn.read_game(pgn_file)
+    if game is None:
+        return None
+
+    board = game.board()
+    tracker = PieceTracker(board)
+    converted_moves = []
+
+    # Extract and convert moves
+    for move in game.mainline_moves():
+        convert_move(tracker, board, move, converted_moves)
+        board.push(move)  # Update the board after the move
+
+    # Check if the result is stored in the PGN file
+    append_outcome(board, game.headers.get("Result", "Unknown"), converted_moves)
+    return converted_moves
+
+# Streaming converter: emits the commands while the PGN is being parsed. No game tree is built,
+# variations are skipped, comments (including the %clk annotations) are ignored and every move
+# is played exactly once, on the parser's own board.
+# The time spent in convert_move and the number of moves are kept for the run statistics.
+class ReplayCommandVisitor(chess.pgn.BaseVisitor):
+    def __init__(self):
+        self.conversion_seconds = 0.0
+        self.moves = 0
+
+    def begin_game(self):
+        self.tracker = None
+        self.converted_moves = []
+        self.result_header = "Unknown"
+        self.board = None
+
+    def visit_header(self, tagname, tagvalue):
+        if tagname == "Result":
+            self.result_header = tagvalue
+
+    def visit_board(self, board):
+        # The parser keeps pushing moves onto this same board, so it always holds the current position
+        if self.tracker is None:
+            self.tracker = PieceTracker(board)
+        self.board = board
+
+    def visit_move(self, board, move):
+        start = time.perf_counter()
+        convert_move(self.tracker, board, move, self.converted_moves)
+        self.conversion_seconds += time.perf_counter() - start
+        self.moves += 1
+
+    def begin_variation(self):
+        return chess.pgn.SKIP
+
+    def end_game(self):
+        append_outcome(self.board, self.result_header, self.converted_moves)
+
+    def handle_error(self, error):
+        # Same as the default GameBuilder: report the error and keep the moves parsed so far
+        LOGGER.warning("Error while parsing game: %s", error)
+
+    def result(self):
+        return self.converted_moves
+
+# Convert the next game in an open PGN file. Returns None if no game is left.
+# Parsing and conversion are interleaved; the parse time is what remains after the time spent in convert_move.
+def read_converted_game(pgn_file, stats=NULL_STATS):
+    visitor = ReplayCommandVisitor()
+    start = time.perf_counter()
+    converted_moves = chess.pgn.read_game(pgn_file, Visitor=lambda: visitor)
+    elapsed = time.perf_counter() - start
+    if converted_moves is not None:
+        stats.record("pgn_parse", elapsed - visitor.conversion_seconds)
+        stats.record("conversion", visitor.conversion_seconds)
+        stats.add("games")
+        stats.add("moves", visitor.moves)
+    return converted_moves
+
+# Convert every game of an open PGN file, one game at a time, so memory use does not grow with the file
+def iter_converted_games(pgn_file, stats=NULL_STATS):
+    while True:
+        converted_moves = read_converted_game(pgn_file, stats)
+        if converted_moves is None:
+            return
+        yield converted_moves
+
+# Output file of the n-th game of a multi-game PGN file, e.g. converted_<name>_000001.pgn
+def numbered_output_filepath(output_filepath, number):
+    root, extension = os.path.splitext(output_filepath)
+    return f"{root}_{number:06d}{extension}"
+
+# Pair the games of a PGN file with their output files: a single game keeps the plain output name,
+# the games of a multi-game file are numbered. Only one game is read ahead.
+def pair_game_outputs(games, output_filepath):
+    games = iter(games)
+    first = next(games, None)
+    if first is None:
+        return
+    second = next(games, None)
+    if second is None:
+        yield output_filepath, first
+        return
+    for number, game in enumerate(itertools.chain((first, second), games), 1):
+        yield numbered_output_filepath(output_filepath, number), game
+
+# Convert the game in a PGN string into replay commands. Returns None if the string holds no game.
+def convert_game(pgn_text, stats=NULL_STATS):
+    stats.add("bytes_in", len(pgn_text))
+    return read_converted_game(io.StringIO(pgn_text), stats)
+
+# Write the converted moves to the output file
+def write_converted_moves(output_filepath, converted_moves, stats=NULL_STATS):
+    text = "".join(move + "\n" for move in converted_moves)
+    with stats.timed("output_write"):
+        write_text(output_filepath, text)
+    stats.add("bytes_out", len(text))
+
+# Function to process and convert a PGN file. Each game is written as soon as it is converted.
+# Returns the output files written, which is an empty list if the file holds no game.
+def convert_pgn_file(pgn_filepath, output_filepath, stats=NULL_STATS):
+    stats.add("bytes_in", os.path.getsize(pgn_filepath))
+    outputs = []
+    with open(pgn_filepath) as pgn_file:
+        for game_output_filepath, converted_moves in pair_game_outputs(iter_converted_games(pgn_file, stats), output_filepath):
+            write_converted_moves(game_output_filepath, converted_moves, stats)
+            outputs.append(game_output_filepath)
+
+    # If no game found, skip the file
+    if not outputs:
+        LOGGER.warning("No valid game found in %s", pgn_filepath)
+    return outputs
@@ -0,0 +1,187 @@
+# Synthetic corpus: seeded random legal games written as chess.com-style PGN files, for load testing
+# the converter without any network access
+import datetime
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import chess
+
+from replay_etl.util import write_text
+
+# Player name of the generated games, which also prefixes the file names
+SYNTHETIC_USERNAME = "synthetic"
+
+# end_time of the first generated game; game n ends n seconds later, so every file name is unique
+FIRST_END_TIME = 1704067200  # 2024-01-01 00:00:00 UTC
+
+TIME_CONTROLS = (60, 180, 600, 1800)
+
+# Chance of playing a castling, en passant or promotion move whenever one is legal. Uniformly random games
+# rarely reach these moves, and they are exactly where converter bugs hide.
+SPECIAL_MOVE_BIAS = 0.5
+
+# Promotion pieces are chosen uniformly, so three out of four promotions are underpromotions
+PROMOTION_PIECES = (chess.QUEEN, chess.ROOK, chess.BISHOP, chess.KNIGHT)
+
+# Parse a corpus size such as 10000, 10k, 100k or 1M
+def parse_size(text):
+    multipliers = {"k": 1000, "m": 1000000}
+    text = text.strip().lower()
+    if text and text[-1] in multipliers:
+        return int(float(text[:-1]) * multipliers[text[-1]])
+    return int(text)
+
+# Legal castling, en passant and promotion moves, generated directly instead of testing every legal move
+def special_moves(board):
+    promotion_rank = chess.BB_RANK_7 if board.turn == chess.WHITE else chess.BB_RANK_2
+    specials = [move for move in board.generate_castling_moves() if board.is_legal(move)]
+    specials.extend(board.generate_legal_ep())
+    specials.extend(board.generate_legal_moves(from_mask=board.pawns & board.occupied_co[board.turn] & promotion_rank))
+    return specials
+
+# Pick a random piece of the side to move, then a random legal move of that piece, trying the other pieces
+# when it has none. Generating the moves of one piece at a time is much cheaper than generating every legal
+# move each ply. Returns None if there is no legal move (checkmate or stalemate).
+def random_legal_move(rng, board):
+    squares = list(chess.SquareSet(board.occupied_co[board.turn]))
+    rng.shuffle(squares)
+    for square in squares:
+        moves = list(board.generate_pseudo_legal_moves(from_mask=chess.BB_SQUARES[square]))
+        rng.shuffle(moves)
+        for move in moves:
+            if not board.is_into_check(move):
+                return move
+    return None
+
+# Pick the next move: a special move if one is legal and the bias says so, otherwise any legal move.
+# A promotion is replaced by a promotion to a random piece, so underpromotions are as likely as queens.
+def choose_move(rng, board):
+    specials = special_moves(board)
+    move = rng.choice(specials) if specials and rng.random() < SPECIAL_MOVE_BIAS else random_legal_move(rng, board)
+    if move is not None and move.promotion:
+        move = chess.Move(move.from_square, move.to_square, rng.choice(PROMOTION_PIECES))
+    return move
+
+# Features of a move, counted to show that the corpus covers them
+def move_features(board, move):
+    if board.is_castling(move):
+        return ("kingside_castling",) if board.is_kingside_castling(move) else ("queenside_castling",)
+    if board.is_en_passant(move):
+        return ("en_passant",)
+    if move.promotion == chess.QUEEN:
+        return ("promotion",)
+    if move.promotion:
+        return ("underpromotion",)
+    return ()
+
+def format_clock(seconds):
+    return f"{int(seconds // 3600)}:{int(seconds % 3600 // 60):02d}:{seconds % 60:04.1f}"
+
+# Play one random game. The same seed and index always give the same game.
+# Returns the PGN text and a dict of feature counts.
+def generate_game(seed, index, max_plies=300):
+    rng = random.Random(f"{seed}:{index}")
+    board = chess.Board()
+    time_control = rng.choice(TIME_CONTROLS)
+    clocks = [float(time_control), float(time_control)]
+    features = {}
+    movetext = []
+
+    for _ in range(rng.randint(10, max_plies)):
+        if board.is_insufficient_material():
+            break
+        move = choose_move(rng, board)
+        if move is None:
+            break
+        for feature in move_features(board, move):
+            features[feature] = features.get(feature, 0) + 1
+
+        side = 0 if board.turn == chess.WHITE else 1
+        clocks[side] = max(0.0, clocks[side] - rng.uniform(0.1, time_control / 60))
+        number = f"{board.fullmove_number}." if board.turn == chess.WHITE else f"{board.fullmove_number}..."
+        movetext.append(f"{number} {board.san_and_push(move)} {{[%clk {format_clock(clocks[side])}]}}")
+        if not clocks[side]:
+            break
+
+    white, black = f"{SYNTHETIC_USERNAME}_white", f"{SYNTHETIC_USERNAME}_black"
+    if board.is_checkmate():
+        result = "0-1" if board.turn == chess.WHITE else "1-0"
+        termination = f"{black if board.turn == chess.WHITE else white} won by checkmate"
+    elif not min(clocks):
+        # The side that just moved ran out of time
+        result = "1-0" if board.turn == chess.WHITE else "0-1"
+        termination = f"{white if board.turn == chess.WHITE else black} won on time"
+    elif board.is_stalemate() or board.is_insufficient_material():
+        result = "1/2-1/2"
+        termination = "Game drawn by stalemate" if board.is_stalemate() else "Game drawn by insufficient material"
+    else:
+        # Unfinished games end with a resignation of the side to move
+        result = "0-1" if board.turn == chess.WHITE else "1-0"
+        termination = f"{black if board.turn == chess.WHITE else white} won by resignation"
+    features["games"] = 1
+
+    end_time = FIRST_END_TIME + index
+    end = datetime.datetime.fromtimestamp(end_time, datetime.timezone.utc)
+    start = end - datetime.timedelta(seconds=len(board.move_stack) * 5)
+    headers = [
+        ("Event", "Live Chess"),
+        ("Site", "Chess.com"),
+        ("Date", start.strftime("%Y.%m.%d")),
+        ("Round", "-"),
+        ("White", white),
+        ("Black", black),
+        ("Result", result),
+        # chess.com writes the position without the move counters
+        ("CurrentPosition", " ".join(board.fen().split()[:4])),
+        ("Timezone", "UTC"),
+        ("ECO", "A00"),
+        ("UTCDate", start.strftime("%Y.%m.%d")),
+        ("UTCTime", start.strftime("%H:%M:%S")),
+        ("WhiteElo", str(rng.randint(400, 2800))),
+        ("BlackElo", str(rng.randint(400, 2800))),
+        ("TimeControl", str(time_control)),
+        ("Termination", termination),
+        ("StartTime", start.strftime("%H:%M:%S")),
+        ("EndDate", end.strftime("%Y.%m.%d")),
+        ("EndTime", end.strftime("%H:%M:%S")),
+        ("Link", f"https://www.chess.com/game/live/{end_time}"),
+    ]
+    header_text = "".join(f'[{name} "{value}"]\n' for name, value in headers)
+    return f"{header_text}\n{' '.join(movetext)} {result}\n", features
+
+# Worker entry point: writes the games of one file. job is (directory, seed, first index, game count).
+# Returns the feature counts of the file.
+def generate_file(job):
+    directory, seed, first_index, count = job
+    totals = {}
+    games = []
+    for index in range(first_index, first_index + count):
+        pgn, features = generate_game(seed, index)
+        games.append(pgn)
+        for feature, value in features.items():
+            totals[feature] = totals.get(feature, 0) + value
+    filename = f"{SYNTHETIC_USERNAME}_game_{FIRST_END_TIME + first_index}.pgn"
+    write_text(os.path.join(directory, filename), "\n".join(games))
+    return totals
+
+# Write count random games into directory, games_per_file games per file (one file per game by default,
+# like the downloaded corpus; larger values produce multi-game dumps). Returns the feature counts.
+def generate_corpus(directory, count, seed=0, games_per_file=1, workers=1):
+    os.makedirs(directory, exist_ok=True)
+    jobs = [(directory, seed, first_index, min(games_per_file, count - first_index))
+            for first_index in range(0, count, games_per_file)]
+
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(generate_file, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    else:
+        results = [generate_file(job) for job in jobs]
+
+    totals = {}
+    for result in results:
+        for feature, value in result.items():
+            totals[feature] = totals.get(feature, 0) + value
+    print(f"Generated {count} games in {len(jobs)} files in {directory} (seed {seed}): "
+          + ", ".join(f"{value} {feature}" for feature, value in sorted(totals.items()) if feature != "games"))
+    return totals
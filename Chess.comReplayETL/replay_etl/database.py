@@ -0,0 +1,242 @@
+# SQLite game database: headers, raw movetext, converted commands and derived fields of every game,
+# indexed by player, date, ECO and result, so that games are selected with a query instead of a
+# directory scan that parses every PGN file
+import io
+import json
+import logging
+import os
+import re
+import sqlite3
+
+import chess.pgn
+
+from replay_etl.converter import pair_game_outputs, read_converted_game
+from replay_etl.manifest import fingerprint_file
+
+LOGGER = logging.getLogger(__name__)
+
+# Bumped when the schema changes; an older database is rebuilt from scratch
+SCHEMA_VERSION = 1
+
+# One row per game. source is the PGN file the game came from and source_sha256 the hash of that file,
+# which tells whether a file has to be loaded again. Player names compare case-insensitively, like chess.com
+# usernames. date is the UTC date as YYYY-MM-DD, so that date ranges compare as strings.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    game_id TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    source_sha256 TEXT NOT NULL,
+    white TEXT COLLATE NOCASE,
+    black TEXT COLLATE NOCASE,
+    white_elo INTEGER,
+    black_elo INTEGER,
+    date TEXT,
+    eco TEXT,
+    result TEXT,
+    termination TEXT,
+    time_control TEXT,
+    ply_count INTEGER,
+    outcome TEXT,
+    headers TEXT NOT NULL,
+    movetext TEXT NOT NULL,
+    commands TEXT
+);
+CREATE INDEX IF NOT EXISTS games_white ON games (white, date);
+CREATE INDEX IF NOT EXISTS games_black ON games (black, date);
+CREATE INDEX IF NOT EXISTS games_date ON games (date);
+CREATE INDEX IF NOT EXISTS games_eco ON games (eco, date);
+CREATE INDEX IF NOT EXISTS games_result ON games (result, date);
+CREATE INDEX IF NOT EXISTS games_source ON games (source);
+"""
+
+COLUMNS = ("game_id", "source", "source_sha256", "white", "black", "white_elo", "black_elo", "date", "eco", "result",
+           "termination", "time_control", "ply_count", "outcome", "headers", "movetext", "commands")
+
+# Results relative to the player of a query
+PLAYER_RESULTS = {
+    "win": ("1-0", "0-1"),
+    "loss": ("0-1", "1-0"),
+    "draw": ("1/2-1/2", "1/2-1/2"),
+}
+
+def parse_int(text):
+    try:
+        return int(text)
+    except (TypeError, ValueError):
+        return None
+
+# "2024.01.05" -> "2024-01-05"; unknown dates such as "????.??.??" are None
+def parse_date(text):
+    if text and re.fullmatch(r"\d{4}\.\d{2}\.\d{2}", text):
+        return text.replace(".", "-")
+    return None
+
+# Row of one game. converted_moves is None when the converter found no valid game in the PGN.
+def game_row(game_id, source, source_sha256, pgn_text, converted_moves):
+    headers = chess.pgn.read_headers(io.StringIO(pgn_text)) or chess.pgn.Headers()
+    # Everything after the blank line that ends the header section
+    parts = re.split(r"\r?\n[ \t]*\r?\n", pgn_text.strip(), maxsplit=1)
+    movetext = parts[1].strip() if len(parts) > 1 else ""
+    ply_count = outcome = commands = None
+    if converted_moves is not None:
+        ply_count = sum(1 for move in converted_moves if move.startswith("Original:"))
+        outcome = next((move[len("Outcome:"):].strip() for move in converted_moves if move.startswith("Outcome:")), None)
+        commands = "".join(move + "\n" for move in converted_moves)
+    return (game_id, source, source_sha256, headers.get("White"), headers.get("Black"),
+            parse_int(headers.get("WhiteElo")), parse_int(headers.get("BlackElo")),
+            parse_date(headers.get("UTCDate") or headers.get("Date")), headers.get("ECO"), headers.get("Result"),
+            headers.get("Termination"), headers.get("TimeControl"), ply_count, outcome,
+            json.dumps(dict(headers)), movetext, commands)
+
+class GameDatabase:
+    # Rows are inserted batch_size at a time, each batch in one transaction
+    def __init__(self, path, batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            LOGGER.info("Creating the game database schema in %s", path)
+            self.connection.executescript(f"DROP TABLE IF EXISTS games; {SCHEMA} PRAGMA user_version = {SCHEMA_VERSION};")
+        self.pending_sources = []
+        self.pending_rows = []
+        self.uncommitted = 0
+        self.loaded = 0
+
+    # True if the games of the source file were loaded from the same content
+    def has_source(self, source, source_sha256):
+        if any(pending == (source, source_sha256) for pending in self.pending_sources):
+            return True
+        row = self.connection.execute("SELECT source_sha256 FROM games WHERE source = ? LIMIT 1", (source,)).fetchone()
+        return row is not None and row[0] == source_sha256
+
+    # Replace the games of a source file. games is an iterable of (game_id, pgn_text, converted_moves), consumed
+    # one game at a time. The games of a source are committed together, even when they span several batches.
+    def add_source(self, source, source_sha256, games):
+        self.pending_sources.append((source, source_sha256))
+        try:
+            for game_id, pgn_text, converted_moves in games:
+                self.pending_rows.append(game_row(game_id, source, source_sha256, pgn_text, converted_moves))
+                if len(self.pending_rows) >= self.batch_size:
+                    self.write_pending()
+        except BaseException:
+            # Drops the uncommitted sources too; they are loaded again on the next run
+            self.connection.rollback()
+            self.pending_sources = []
+            self.pending_rows = []
+            self.uncommitted = 0
+            raise
+        if self.uncommitted + len(self.pending_rows) >= self.batch_size:
+            self.flush()
+
+    # Write the pending rows into the open transaction
+    def write_pending(self):
+        # Games the file no longer contains are dropped with the old rows
+        self.connection.executemany("DELETE FROM games WHERE source = ?", [(source,) for source, _ in self.pending_sources])
+        self.connection.executemany(f"INSERT OR REPLACE INTO games ({', '.join(COLUMNS)}) "
+                                    f"VALUES ({', '.join('?' * len(COLUMNS))})", self.pending_rows)
+        self.uncommitted += len(self.pending_rows)
+        self.pending_sources = []
+        self.pending_rows = []
+
+    def flush(self):
+        if not self.pending_sources and not self.uncommitted:
+            return
+        with self.connection:
+            self.write_pending()
+        self.loaded += self.uncommitted
+        self.uncommitted = 0
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+# Reads a PGN file line by line for chess.pgn.read_game and keeps the text of the game being read
+class GameTextReader:
+    def __init__(self, handle):
+        self.handle = handle
+        self.lines = []
+
+    def readline(self):
+        line = self.handle.readline()
+        self.lines.append(line)
+        return line
+
+    # Text read since the previous call
+    def take(self):
+        text = "".join(self.lines)
+        self.lines = []
+        return text
+
+# (pgn_text, converted_moves) of every game of an open PGN file, one game at a time
+def iter_source_games(pgn_file):
+    reader = GameTextReader(pgn_file)
+    while True:
+        converted_moves = read_converted_game(reader)
+        if converted_moves is None:
+            return
+        yield reader.take(), converted_moves
+
+# Load every PGN file of the directory that changed since it was loaded. The games get the ids of their
+# converted outputs: the file name for a single game, numbered names for the games of a multi-game file.
+# Files are hashed in blocks and their games read one at a time, so memory use does not grow with the file.
+def load_pgn_directory(database, pgn_directory):
+    filenames = sorted(filename for filename in os.listdir(pgn_directory) if filename.endswith(".pgn"))
+    skipped = 0
+    for filename in filenames:
+        pgn_filepath = os.path.join(pgn_directory, filename)
+        sha256 = fingerprint_file(pgn_filepath)["sha256"]
+        if database.has_source(filename, sha256):
+            skipped += 1
+            continue
+
+        with open(pgn_filepath) as pgn_file:
+            database.add_source(filename, sha256, ((game_id, pgn_text, converted_moves) for game_id, (pgn_text, converted_moves)
+                                                   in pair_game_outputs(iter_source_games(pgn_file), filename)))
+    database.flush()
+    print(f"Loaded {len(filenames) - skipped} files into {database.path}, {skipped} unchanged")
+
+# Select games, newest first. result is "1-0", "0-1" or "1/2-1/2", or with a player "win", "loss" or "draw"
+# from that player's point of view. date_from and date_to are inclusive YYYY-MM-DD bounds.
+# Returns a list of dicts with the indexed columns and the ply count.
+def query_games(database_path, player=None, eco=None, result=None, date_from=None, date_to=None, limit=None):
+    conditions, parameters = [], []
+    if player is not None and result in PLAYER_RESULTS:
+        white_result, black_result = PLAYER_RESULTS[result]
+        conditions.append("((white = ? AND result = ?) OR (black = ? AND result = ?))")
+        parameters += [player, white_result, player, black_result]
+    else:
+        if result in PLAYER_RESULTS:
+            raise ValueError(f"A {result} result needs a player")
+        if player is not None:
+            conditions.append("(white = ? OR black = ?)")
+            parameters += [player, player]
+        if result is not None:
+            conditions.append("result = ?")
+            parameters.append(result)
+    if eco is not None:
+        conditions.append("eco = ?")
+        parameters.append(eco)
+    if date_from is not None:
+        conditions.append("date >= ?")
+        parameters.append(date_from)
+    if date_to is not None:
+        conditions.append("date <= ?")
+        parameters.append(date_to)
+
+    sql = "SELECT game_id, white, black, date, eco, result, ply_count FROM games"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY date DESC, game_id"
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+    connection = sqlite3.connect(database_path)
+    try:
+        connection.row_factory = sqlite3.Row
+        return [dict(row) for row in connection.execute(sql, parameters)]
+    finally:
+        connection.close()
@@ -0,0 +1,85 @@
+# External sort of fixed-size binary records, for index files that do not fit in memory.
+# Records are compared as bytes, so fields packed big-endian sort in numeric order, field by field.
+import contextlib
+import heapq
+import os
+import shutil
+import tempfile
+
+# Read the records of a sorted run file one at a time
+def iter_records(path, record_size, buffer_records=65536):
+    with open(path, "rb") as run_file:
+        while True:
+            chunk = run_file.read(record_size * buffer_records)
+            if not chunk:
+                return
+            for offset in range(0, len(chunk), record_size):
+                yield chunk[offset:offset + record_size]
+
+# Yield the records of an iterable in sorted order, keeping at most chunk_records records in memory.
+# Each full chunk is sorted and written to a temporary run file, and the runs are merged while yielding.
+def iter_sorted(records, record_size, chunk_records=1000000, temp_directory=None):
+    run_paths = []
+    chunk = []
+    directory = tempfile.mkdtemp(prefix="extsort-", dir=temp_directory)
+    try:
+        def write_run():
+            chunk.sort()
+            run_path = os.path.join(directory, f"run-{len(run_paths):05d}.dat")
+            with open(run_path, "wb") as run_file:
+                run_file.writelines(chunk)
+            run_paths.append(run_path)
+            chunk.clear()
+
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= chunk_records:
+                write_run()
+
+        if run_paths:
+            if chunk:
+                write_run()
+            yield from heapq.merge(*(iter_records(run_path, record_size) for run_path in run_paths))
+        else:
+            # Everything fitted in memory, no run files needed
+            chunk.sort()
+            yield from chunk
+    finally:
+        for run_path in run_paths:
+            os.remove(run_path)
+        os.rmdir(directory)
+
+# Sort an iterable of records into output_path. Returns the number of records written.
+def external_sort(records, output_path, record_size, chunk_records=1000000, temp_directory=None):
+    written = 0
+    temp_path = output_path + ".tmp"
+    with open(temp_path, "wb") as output_file:
+        for record in iter_sorted(records, record_size, chunk_records, temp_directory):
+            output_file.write(record)
+            written += 1
+    os.replace(temp_path, output_path)
+    return written
+
+# Temporary directory for spilled record files, removed with whatever is still in it
+@contextlib.contextmanager
+def spill_directory(temp_directory=None):
+    directory = tempfile.mkdtemp(prefix="spill-", dir=temp_directory)
+    try:
+        yield directory
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+# Write an iterable of records to a new file in directory and return its path. Worker processes hand their
+# records to the sorting process this way, instead of returning them all in memory.
+def spill_records(records, directory):
+    handle, path = tempfile.mkstemp(prefix="records-", suffix=".dat", dir=directory)
+    with os.fdopen(handle, "wb") as spill_file:
+        spill_file.writelines(records)
+    return path
+
+# Read the records of a spilled file one at a time, then delete it
+def drain_records(path, record_size):
+    try:
+        yield from iter_records(path, record_size)
+    finally:
+        os.remove(path)
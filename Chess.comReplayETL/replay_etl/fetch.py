@@ -0,0 +1,329 @@
+# Fetch stage: downloads monthly game archives from the chess.com API
+import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from replay_etl.checkpoint import NULL_CHECKPOINT
+from replay_etl.filters import ACCEPT_ALL
+from replay_etl.stats import NULL_STATS
+from replay_etl.util import game_filename, write_json_atomic, write_text
+
+LOGGER = logging.getLogger(__name__)
+
+# Add headers, including a User-Agent to mimic a browser request
+headers = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/85.0.4183.121 Safari/537.36"
+}
+
+# Chess.com published-data API. Can be pointed at a local stand-in that serves fixture archives.
+DEFAULT_API_BASE_URL = "https://api.chess.com/pub"
+
+# Seconds to wait for a connection and between bytes of a response, so that a stalled server cannot hang a download thread
+REQUEST_TIMEOUT = (10, 60)
+
+# Token-bucket rate limiter shared by all download threads: allows bursts of up to
+# capacity requests, then at most rate requests per second
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Block until a token is available, then take it
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# One pooled session for all downloads, so connections are reused instead of a new TLS handshake per month.
+# Throttled (429) and server errors are retried with backoff, honouring Retry-After.
+def create_session(concurrency):
+    session = requests.Session()
+    session.headers.update(headers)
+    retries = Retry(total=3, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency, max_retries=retries)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# Chess.com API URL for fetching one month of games
+def archive_url(base_url, username, year, month):
+    return f"{base_url}/player/{username}/games/{year}/{month}"
+
+# Every (year, month) from start to end inclusive, both given as "YYYY-MM"
+def month_range(start, end):
+    start_year, start_month = (int(part) for part in start.split("-"))
+    end_year, end_month = (int(part) for part in end.split("-"))
+    months = []
+    while (start_year, start_month) <= (end_year, end_month):
+        months.append((f"{start_year:04d}", f"{start_month:02d}"))
+        start_month += 1
+        if start_month > 12:
+            start_year, start_month = start_year + 1, 1
+    return months
+
+# Ask chess.com which months a player has games in
+def discover_archives(session, limiter, base_url, username):
+    limiter.acquire()
+    try:
+        response = session.get(f"{base_url}/player/{username}/games/archives", timeout=REQUEST_TIMEOUT)
+    except requests.RequestException as error:
+        LOGGER.error("Failed to list archives of %s: %s", username, error)
+        return None
+    if response.status_code != 200:
+        LOGGER.error("Failed to list archives of %s. Status code: %s", username, response.status_code)
+        return None
+    return response.json()["archives"]
+
+# Download one monthly archive. Validators of a cached copy turn it into a conditional request,
+# answered with 304 Not Modified when the archive did not change. Returns None if the request failed, including
+# connection errors, timeouts and retries running out, so that one bad month does not abort the other downloads.
+def download_archive(session, limiter, url, cached=None, stats=NULL_STATS):
+    request_headers = {}
+    if cached:
+        if cached.get("etag"):
+            request_headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            request_headers["If-Modified-Since"] = cached["last_modified"]
+
+    limiter.acquire()
+    LOGGER.info("Making API Call to %s", url)
+    try:
+        with stats.timed("http_fetch"):
+            response = session.get(url, headers=request_headers, timeout=REQUEST_TIMEOUT)
+            body = response.content
+    except requests.RequestException as error:
+        LOGGER.error("Failed to retrieve games from %s: %s", url, error)
+        stats.add("http_errors")
+        return None
+    stats.add("bytes_downloaded", len(body))
+    if response.status_code not in (200, 304):
+        LOGGER.error("Failed to retrieve games from %s. Status code: %s", url, response.status_code)
+        return None
+    return response
+
+# Destination of downloaded games in the classic layout: one raw PGN file per game in the pgn directory,
+# converted later by convert_directory
+class PgnDirectorySink:
+    def __init__(self, pgn_directory, stats=NULL_STATS):
+        self.pgn_directory = pgn_directory
+        self.stats = stats
+
+    def has_game(self, filename):
+        return os.path.exists(os.path.join(self.pgn_directory, filename))
+
+    # Save the PGN of every game in an archive. Returns the names of the saved files.
+    # archived_games, all games of the archive when only some are handed over, are not needed here.
+    def add_games(self, username, url, games, archived_games=None):
+        saved = []
+        # Loop through all games
+        for game in games:
+            if 'pgn' in game:
+                pgn_data = game['pgn']
+
+                # Save the PGN to the pgn directory
+                filename = game_filename(username, game)
+                with self.stats.timed("disk_write"):
+                    write_text(os.path.join(self.pgn_directory, filename), pgn_data)
+                saved.append(filename)
+        return saved
+
+    # Every game is on disk as soon as add_games returns
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+# Like executor.map, but with at most window calls submitted and not yet consumed, so that results waiting
+# for a slower consumer never hold more than window archive bodies in memory. Results are yielded in item order.
+def bounded_map(executor, function, items, window):
+    futures = deque()
+    items = iter(items)
+    for item in items:
+        futures.append(executor.submit(function, item))
+        if len(futures) >= window:
+            break
+    while futures:
+        result = futures.popleft().result()
+        # Refill the window before handing the result over, so downloads continue while the consumer works
+        for item in items:
+            futures.append(executor.submit(function, item))
+            break
+        yield result
+
+# A month's archive can no longer change once the month is over. A day of grace covers games
+# that finished right at the end of the month.
+def is_closed_month(url, now=None):
+    year, month = (int(part) for part in url.rstrip("/").split("/")[-2:])
+    next_month = datetime.datetime(year + month // 12, month % 12 + 1, 1, tzinfo=datetime.timezone.utc)
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return now >= next_month + datetime.timedelta(days=1)
+
+# On-disk cache of monthly archives, keyed by URL: the response validators (ETag/Last-Modified),
+# the raw response body and the PGN files that were saved from it.
+class ArchiveCache:
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.json")
+        os.makedirs(directory, exist_ok=True)
+        self.entries = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as index_file:
+                self.entries = json.load(index_file)
+
+    def lookup(self, url):
+        return self.entries.get(url)
+
+    def body_path(self, url):
+        return os.path.join(self.directory, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+    def load_body(self, url):
+        with open(self.body_path(url), "rb") as body_file:
+            return json.loads(body_file.read())
+
+    # Record a 200 response. The archive is marked immutable if it was downloaded after its month closed.
+    # files are the games that passed the game filter, described by filter_key.
+    def store(self, url, response, files, filter_key=ACCEPT_ALL.key()):
+        temp_path = self.body_path(url) + ".tmp"
+        with open(temp_path, "wb") as body_file:
+            body_file.write(response.content)
+        os.replace(temp_path, self.body_path(url))
+        self.entries[url] = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "immutable": is_closed_month(url),
+            "files": files,
+            "filter": filter_key,
+        }
+
+    # A 304 confirms the cached copy; once that happens after the month closed it is final
+    def confirm(self, url):
+        self.entries[url]["immutable"] = is_closed_month(url)
+
+    def save(self):
+        write_json_atomic(self.index_path, self.entries)
+
+# Hand the games of a cached archive that the sink is missing (e.g. after a crash or a manual cleanup)
+# back to the sink, together with every game of the archive that the filter accepts, which a sink that keeps
+# whole archives needs to write the archive again. Returns the number of games restored.
+def restore_missing_games(cache, url, username, sink, game_filter=ACCEPT_ALL):
+    entry = cache.lookup(url)
+    # Archives cached before the filter existed were stored unfiltered
+    if entry.get("filter", ACCEPT_ALL.key()) == game_filter.key():
+        missing = {filename for filename in entry["files"] if not sink.has_game(filename)}
+        if not missing:
+            return 0
+        archived = [game for game in game_filter.apply(cache.load_body(url)['games']) if 'pgn' in game]
+        games = [game for game in archived if game_filename(username, game) in missing]
+    else:
+        # The filter changed since the archive was cached, so it may now admit games that were never saved
+        archived = [game for game in game_filter.apply(cache.load_body(url)['games']) if 'pgn' in game]
+        entry["files"] = [game_filename(username, game) for game in archived]
+        entry["filter"] = game_filter.key()
+        games = [game for game in archived if not sink.has_game(game_filename(username, game))]
+    return len(sink.add_games(username, url, games, archived))
+
+# Download the archives of several players concurrently and hand each archive's games to the sink.
+# months is a list of (year, month) pairs; None discovers every month from the player's archive list.
+# With a cache directory, unchanged archives are neither transferred nor written again, and closed
+# months are not requested at all. Games rejected by game_filter never reach the sink. Archives the
+# checkpoint lists as fetched are skipped. Returns the URLs that could not be retrieved.
+def fetch_archives(usernames, sink, months=None, base_url=DEFAULT_API_BASE_URL, concurrency=4, rate_limit=5.0,
+                   cache_directory=None, stats=NULL_STATS, game_filter=ACCEPT_ALL, checkpoint=NULL_CHECKPOINT):
+    session = create_session(concurrency)
+    limiter = TokenBucket(rate_limit)
+    cache = ArchiveCache(cache_directory) if cache_directory else None
+    failed = []
+
+    jobs = []
+    for username in usernames:
+        if months is None:
+            urls = discover_archives(session, limiter, base_url, username)
+            if urls is None:
+                failed.append(f"{base_url}/player/{username}/games/archives")
+                continue
+        else:
+            urls = [archive_url(base_url, username, year, month) for year, month in months]
+        jobs.extend((username, url) for url in urls)
+
+    unlisted = len(failed)
+    resumed = sum(1 for username, url in jobs if checkpoint.is_fetched(url))
+    jobs = [(username, url) for username, url in jobs if not checkpoint.is_fetched(url)]
+
+    # A checkpoint first makes the sink and the cache persist what they hold
+    checkpoint.add_hook(sink.flush)
+    if cache:
+        checkpoint.add_hook(cache.save)
+
+    saved = 0
+    immutable = 0
+    not_modified = 0
+    filtered = 0
+    pending = []
+    try:
+        for username, url in jobs:
+            cached = cache.lookup(url) if cache else None
+            if cached and cached["immutable"]:
+                saved += restore_missing_games(cache, url, username, sink, game_filter)
+                immutable += 1
+                checkpoint.archive_fetched(url)
+            else:
+                pending.append((username, url, cached))
+
+        print(f"Downloading {len(pending)} monthly archives for {len(usernames)} players ({concurrency} at a time, "
+              f"{immutable} closed months served from the cache, {resumed} already fetched before the checkpoint)")
+        with session, ThreadPoolExecutor(max_workers=concurrency) as executor:
+            # Results arrive in job order, so games are written in the same order every run. Only twice as many
+            # archives as there are download threads are in flight or waiting for the sink at any time.
+            responses = bounded_map(executor, lambda job: download_archive(session, limiter, job[1], job[2], stats),
+                                    pending, 2 * concurrency)
+            for (username, url, cached), response in zip(pending, responses):
+                if response is None:
+                    failed.append(url)
+                elif response.status_code == 304:
+                    cache.confirm(url)
+                    saved += restore_missing_games(cache, url, username, sink, game_filter)
+                    not_modified += 1
+                else:
+                    games = response.json()['games']
+                    accepted = game_filter.apply(games)
+                    filtered += len(games) - len(accepted)
+                    files = sink.add_games(username, url, accepted)
+                    saved += len(files)
+                    if cache:
+                        cache.store(url, response, files, game_filter.key())
+                if response is not None:
+                    checkpoint.archive_fetched(url)
+    finally:
+        # Also persist what was downloaded so far when the run is interrupted
+        checkpoint.save()
+        checkpoint.remove_hook(sink.flush)
+        if cache:
+            checkpoint.remove_hook(cache.save)
+        sink.close()
+        if cache:
+            cache.save()
+
+    stats.add("games_filtered", filtered)
+    print(f"Saved {saved} games from {len(jobs) - (len(failed) - unlisted)} archives ({not_modified} not modified, "
+          f"{filtered} games filtered out)")
+    return failed
@@ -0,0 +1,61 @@
+# Game filter evaluated on the metadata of the monthly archive JSON, before any PGN is written or parsed
+import json
+
+# Keys of the "game_filter" config section. A missing or null key does not filter.
+#   time_classes - list of accepted time classes, e.g. ["bullet", "blitz", "rapid"] to drop daily games
+#   rules        - list of accepted rule sets, e.g. ["chess"] to drop variants such as chess960
+#   rated        - true for rated games only, false for unrated games only
+#   min_rating   - both players must be rated at least this much
+#   max_rating   - both players must be rated at most this much
+FILTER_KEYS = ("time_classes", "rules", "rated", "min_rating", "max_rating")
+
+class GameFilter:
+    def __init__(self, time_classes=None, rules=None, rated=None, min_rating=None, max_rating=None):
+        self.time_classes = set(time_classes) if time_classes is not None else None
+        self.rules = set(rules) if rules is not None else None
+        self.rated = rated
+        self.min_rating = min_rating
+        self.max_rating = max_rating
+
+    # Stable description of the filter, stored with cached archives to notice when the filter changed
+    def key(self):
+        return json.dumps({
+            "time_classes": sorted(self.time_classes) if self.time_classes is not None else None,
+            "rules": sorted(self.rules) if self.rules is not None else None,
+            "rated": self.rated,
+            "min_rating": self.min_rating,
+            "max_rating": self.max_rating,
+        }, sort_keys=True)
+
+    def matches(self, game):
+        if self.time_classes is not None and game.get("time_class") not in self.time_classes:
+            return False
+        if self.rules is not None and game.get("rules") not in self.rules:
+            return False
+        if self.rated is not None and game.get("rated") != self.rated:
+            return False
+        if self.min_rating is not None or self.max_rating is not None:
+            for side in ("white", "black"):
+                rating = game.get(side, {}).get("rating")
+                if rating is None:
+                    return False
+                if self.min_rating is not None and rating < self.min_rating:
+                    return False
+                if self.max_rating is not None and rating > self.max_rating:
+                    return False
+        return True
+
+    # Keep the games that pass the filter, in archive order
+    def apply(self, games):
+        return [game for game in games if self.matches(game)]
+
+# Filter that keeps every game
+ACCEPT_ALL = GameFilter()
+
+# Build the filter from the "game_filter" section of the config
+def load_game_filter(config):
+    section = config.get("game_filter") or {}
+    unknown = set(section) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown game_filter keys: {', '.join(sorted(unknown))}")
+    return GameFilter(**section)
@@ -0,0 +1,40 @@
+# Import-time benchmark of the vendored chess package: fresh interpreters import chess without its attack table
+# cache, which computes the tables and writes the cache, and with the cache in place
+import os
+import statistics
+import subprocess
+import sys
+
+import chess
+
+# Microseconds that a fresh interpreter spends importing chess, including the modules chess imports
+def import_microseconds(package_root):
+    # Like bytecode, the cache is not written under PYTHONDONTWRITEBYTECODE, which would leave nothing to measure
+    env = {name: value for name, value in os.environ.items() if name != "PYTHONDONTWRITEBYTECODE"}
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", "import chess"], cwd=package_root,
+                               capture_output=True, text=True, check=True, env=env)
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == "chess":
+            return int(fields[1])
+    raise ValueError("python -X importtime did not report the import of chess")
+
+# Time repeat cold imports, each after removing the cache, then repeat warm ones. Returns the timings in microseconds.
+def benchmark_import(repeat=10):
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(chess.__file__)))
+    cache_path = chess._attack_cache_path()
+    timings = {"cold": [], "warm": []}
+    for _ in range(repeat):
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+        timings["cold"].append(import_microseconds(package_root))
+    for _ in range(repeat):
+        timings["warm"].append(import_microseconds(package_root))
+
+    for name, description in (("cold", "computing the attack tables"), ("warm", "loading them from the cache")):
+        print(f"{name}: import chess {statistics.median(timings[name]) / 1000:.1f} ms median, "
+              f"{min(timings[name]) / 1000:.1f} ms best of {repeat}, {description}")
+    saved = statistics.median(timings["cold"]) - statistics.median(timings["warm"])
+    print(f"The cache saves {saved / 1000:.1f} ms per import ({cache_path})")
+    return timings
@@ -0,0 +1,70 @@
+# Conversion manifest: remembers which source files were converted, from which content and by which converter
+import hashlib
+import json
+import logging
+import os
+
+from replay_etl.converter import CONVERTER_VERSION, numbered_output_filepath
+from replay_etl.util import write_json_atomic
+
+LOGGER = logging.getLogger(__name__)
+
+# Load the conversion manifest (source file -> hash, converter version, output path, raw PGN location)
+def load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return {"files": {}}
+    with open(manifest_path) as manifest_file:
+        return json.load(manifest_file)
+
+def save_manifest(manifest_path, manifest):
+    write_json_atomic(manifest_path, manifest)
+
+# Hash a source file. The hash of the previous run is reused when size and mtime are unchanged.
+def fingerprint_file(filepath, previous_entry=None):
+    stat = os.stat(filepath)
+    if previous_entry and previous_entry.get("size") == stat.st_size and previous_entry.get("mtime_ns") == stat.st_mtime_ns:
+        sha256 = previous_entry["sha256"]
+    else:
+        digest = hashlib.sha256()
+        with open(filepath, "rb") as source_file:
+            for chunk in iter(lambda: source_file.read(65536), b""):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+    return {"sha256": sha256, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+# Output files of a manifest entry. "output" is None for a source without a game, a path for a
+# single game and a list of paths for a multi-game source.
+def entry_outputs(entry):
+    output = entry.get("output") if entry else None
+    if output is None:
+        return []
+    return output if isinstance(output, list) else [output]
+
+# Where the raw PGN of a manifest entry lives. Entries converted from the pgn directory carry no "raw" key;
+# entries written by --stream name where it kept the raw PGN: "archive", "store" or "none".
+def entry_raw_location(entry):
+    return entry.get("raw", "pgn")
+
+# Whether the current converter wrote the outputs of an entry to output_filepath, and they still exist
+def has_current_outputs(entry, output_filepath, exists=os.path.exists):
+    if entry is None or entry.get("converter_version") != CONVERTER_VERSION:
+        return False
+    outputs = entry_outputs(entry)
+    if not outputs:  # Source holds no game, nothing to write
+        return True
+    if outputs[0] not in (output_filepath, numbered_output_filepath(output_filepath, 1)):
+        return False
+    return all(exists(output) for output in outputs)
+
+# A game only needs converting again if its source, the converter or the output location changed
+def is_up_to_date(entry, fingerprint, output_filepath, exists=os.path.exists):
+    if entry is None or entry.get("sha256") != fingerprint["sha256"]:
+        return False
+    return has_current_outputs(entry, output_filepath, exists)
+
+# Delete output files that no longer belong to any source file
+def remove_output(output):
+    for output_filepath in output if isinstance(output, list) else [output]:
+        if output_filepath and os.path.exists(output_filepath):
+            os.remove(output_filepath)
+            LOGGER.info("Pruned orphaned output %s", output_filepath)
@@ -0,0 +1,110 @@
+# Perft benchmark of the vendored chess package: nodes/sec of chess.perft on the standard perft positions,
+# whose known node counts also catch move generation bugs, compared against a JSON baseline
+import json
+import os
+import platform
+import subprocess
+import time
+
+import chess
+
+from replay_etl.bench import save_baseline
+from replay_etl.util import write_json_atomic
+
+# (name, FEN, depth, expected nodes): the perft positions of the Chess Programming Wiki, at depths that take
+# about a second each
+POSITIONS = [
+    ("startpos", chess.STARTING_FEN, 4, 197281),
+    # Castling through and out of attacks, en passant, promotions and pins in the middlegame
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", 3, 97862),
+    # En passant captures that would expose the king along the rank
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", 5, 674624),
+    # Promotions with capture and castling rights lost to captured rooks
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", 4, 422333),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", 3, 62379),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", 3, 89890),
+]
+
+# The commit of the benchmarked code, so that results name what they measured; None outside a git checkout
+def git_commit(directory):
+    try:
+        completed = subprocess.run(["git", "rev-parse", "HEAD"], cwd=directory, capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return completed.stdout.strip()
+
+# Run every position repeat times and keep the best time
+def run_perft(repeat=3):
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "commit": git_commit(os.path.dirname(os.path.abspath(chess.__file__))),
+        "positions": {},
+    }
+    for name, fen, depth, expected in POSITIONS:
+        board = chess.Board(fen)
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            nodes = chess.perft(board, depth)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results["positions"][name] = {
+            "fen": fen,
+            "depth": depth,
+            "nodes": nodes,
+            "expected_nodes": expected,
+            "seconds": round(best, 6),
+            "nodes_per_second": round(nodes / best, 1),
+        }
+        print(f"{name:>10} depth {depth}: {nodes:>8} nodes in {best:.3f}s, {nodes / best:10.0f} nodes/sec"
+              + ("" if nodes == expected else f", EXPECTED {expected}"))
+
+    nodes = sum(position["nodes"] for position in results["positions"].values())
+    seconds = sum(position["seconds"] for position in results["positions"].values())
+    results["nodes_per_second"] = round(nodes / seconds, 1)
+    print(f"{'total':>18}: {nodes:>8} nodes in {seconds:.3f}s, {nodes / seconds:10.0f} nodes/sec")
+    return results
+
+# Compare nodes/sec against the baseline, position by position. Returns the regressions slower than threshold_percent.
+def find_perft_regressions(results, baseline, threshold_percent):
+    regressions = []
+    for name, measured in results["positions"].items():
+        expected = baseline.get("positions", {}).get(name)
+        # Only the same position at the same depth is comparable
+        if expected is None or (expected["fen"], expected["depth"]) != (measured["fen"], measured["depth"]):
+            continue
+        change = (measured["nodes_per_second"] - expected["nodes_per_second"]) / expected["nodes_per_second"] * 100
+        if change < -threshold_percent:
+            regressions.append(f"{name}: {measured['nodes_per_second']:.0f} nodes/sec is {-change:.1f}% below the "
+                               f"baseline of {expected['nodes_per_second']:.0f}")
+    return regressions
+
+# Run the perft positions and write the results to results_path. Wrong node counts are failures and are never
+# saved as a baseline; otherwise with save the results become the new baseline, or they are compared with it.
+# Returns the failures and regressions found.
+def perft_benchmark(results_path, baseline_path, threshold_percent=25, save=False, repeat=3):
+    results = run_perft(repeat)
+    write_json_atomic(results_path, results)
+
+    failures = [f"{name}: {position['nodes']} nodes at depth {position['depth']}, expected {position['expected_nodes']}"
+                for name, position in results["positions"].items() if position["nodes"] != position["expected_nodes"]]
+    for failure in failures:
+        print(f"WRONG NODE COUNT: {failure}")
+    if failures:
+        return failures
+
+    if save:
+        save_baseline(baseline_path, results)
+        return []
+    if not os.path.exists(baseline_path):
+        print(f"No baseline at {baseline_path}; run with --save-baseline to create one")
+        return []
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = find_perft_regressions(results, baseline, threshold_percent)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    print(f"{len(regressions)} positions more than {threshold_percent}% slower than the baseline "
+          f"of commit {baseline.get('commit') or 'unknown'}")
+    return regressions
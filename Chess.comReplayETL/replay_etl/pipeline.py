@@ -0,0 +1,301 @@
+# Conversion stage: converts a directory of PGN files, or games handed over by the fetch stage
+import contextlib
+import hashlib
+import io
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from replay_etl.checkpoint import NULL_CHECKPOINT
+from replay_etl.converter import (CONVERTER_VERSION, convert_game, convert_game_tree, convert_pgn_file, iter_converted_games,
+                                  pair_game_outputs, write_converted_moves)
+from replay_etl.manifest import (entry_outputs, entry_raw_location, fingerprint_file, has_current_outputs, is_up_to_date,
+                                 load_manifest, remove_output, save_manifest)
+from replay_etl.stats import NULL_STATS, RunStats
+from replay_etl.store import SegmentStore
+from replay_etl.util import configure_logging, game_filename, remove_temp_files, write_text
+
+LOGGER = logging.getLogger(__name__)
+
+# Time both converters over every PGN file in the directory without writing any output
+def benchmark_converters(pgn_directory, repeat=5):
+    contents = []
+    for filename in sorted(os.listdir(pgn_directory)):
+        if filename.endswith(".pgn"):
+            with open(os.path.join(pgn_directory, filename)) as pgn_file:
+                contents.append(pgn_file.read())
+
+    timings = {}
+    for name, converter in (("tree", lambda content: convert_game_tree(io.StringIO(content))), ("visitor", convert_game)):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for content in contents:
+                converter(content)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best
+        print(f"{name:>8}: {best:.3f}s for {len(contents)} games ({len(contents) / best:.1f} games/sec, best of {repeat})")
+
+    print(f"speedup: {timings['tree'] / timings['visitor']:.2f}x")
+    return timings
+
+# Regression check: convert every PGN file in memory and compare the result with the outputs
+# already on disk. Returns the names of the files whose conversion differs.
+def check_converted_corpus(pgn_directory, converted_moves_directory):
+    mismatches = []
+    filenames = sorted(filename for filename in os.listdir(pgn_directory) if filename.endswith(".pgn"))
+    for filename in filenames:
+        output_filepath = os.path.join(converted_moves_directory, f"converted_{filename}")
+        matched = True
+        with open(os.path.join(pgn_directory, filename)) as pgn_file:
+            for game_output_filepath, converted_moves in pair_game_outputs(iter_converted_games(pgn_file), output_filepath):
+                if not os.path.exists(game_output_filepath):
+                    continue
+                with open(game_output_filepath) as output_file:
+                    expected = output_file.read()
+                if "".join(move + "\n" for move in converted_moves) != expected:
+                    matched = False
+                    print(f"MISMATCH: {game_output_filepath}")
+        if not matched:
+            mismatches.append(filename)
+
+    print(f"Checked {len(filenames)} files: {len(mismatches)} mismatches")
+    return mismatches
+
+# Worker entry point: must live at module level so it can be pickled to the process pool.
+# Returns the output files written and the statistics of the job.
+def convert_job(job):
+    pgn_filepath, output_filepath = job
+    LOGGER.info("Converting %s...", os.path.basename(pgn_filepath))
+    stats = RunStats()
+    outputs = convert_pgn_file(pgn_filepath, output_filepath, stats)
+    return outputs, stats.to_dict()
+
+# Convert every PGN file in the directory, optionally spread over a pool of worker processes.
+# With a manifest only new, changed or stale games are converted and orphaned outputs are pruned.
+# Files the checkpoint lists as converted are skipped, and every checkpoint saves the manifest.
+def convert_directory(pgn_directory, converted_moves_directory, workers=1, manifest_path=None, force=False, stats=NULL_STATS,
+                      checkpoint=NULL_CHECKPOINT):
+    remove_temp_files(converted_moves_directory)
+    # Sort so that the conversion order, and therefore the log and summary, is stable between runs
+    filenames = sorted(filename for filename in os.listdir(pgn_directory) if filename.endswith(".pgn"))
+
+    manifest = load_manifest(manifest_path) if manifest_path else None
+    entries = manifest["files"] if manifest is not None else {}
+
+    pending = []
+    fingerprints = {}
+    for filename in filenames:
+        pgn_filepath = os.path.join(pgn_directory, filename)
+        output_filepath = os.path.join(converted_moves_directory, f"converted_{filename}")
+        if manifest is not None:
+            fingerprints[filename] = fingerprint_file(pgn_filepath, entries.get(filename))
+            if not force and is_up_to_date(entries.get(filename), fingerprints[filename], output_filepath):
+                continue
+        if checkpoint.is_converted(filename):
+            continue
+        pending.append(filename)
+
+    jobs = [(os.path.join(pgn_directory, filename), os.path.join(converted_moves_directory, f"converted_{filename}"))
+            for filename in pending]
+
+    def save():
+        save_manifest(manifest_path, manifest)
+    if manifest is not None:
+        checkpoint.add_hook(save)
+
+    converted = 0
+    try:
+        # Results are recorded as they arrive, so a checkpoint covers every file converted so far
+        with contextlib.ExitStack() as stack:
+            if workers > 1 and len(jobs) > 1:
+                print(f"Converting {len(jobs)} files with {workers} worker processes...")
+                executor = stack.enter_context(ProcessPoolExecutor(max_workers=workers, initializer=configure_logging,
+                                                                   initargs=(logging.getLogger().level,)))
+                # map() yields results in submission order, regardless of which worker finishes first
+                results = executor.map(convert_job, jobs, chunksize=max(1, len(jobs) // (workers * 4)))
+            else:
+                results = map(convert_job, jobs)
+
+            for filename, (pgn_filepath, output_filepath), (outputs, job_stats) in zip(pending, jobs, results):
+                stats.merge(job_stats)
+                if outputs:
+                    converted += 1
+                    LOGGER.info("Saved converted moves to %s", outputs[0] if len(outputs) == 1 else f"{len(outputs)} files")
+                if manifest is not None:
+                    # Outputs of the previous run that this run did not write again, e.g. when a multi-game file shrank
+                    remove_output([output for output in entry_outputs(entries.get(filename)) if output not in outputs])
+                    if not outputs:
+                        output = None
+                    elif outputs == [output_filepath]:
+                        output = output_filepath
+                    else:
+                        output = outputs
+                    entries[filename] = dict(fingerprints[filename], converter_version=CONVERTER_VERSION, output=output)
+                checkpoint.game_converted(filename)
+    finally:
+        if manifest is not None:
+            checkpoint.remove_hook(save)
+            # Keep what was converted before an interruption
+            save_manifest(manifest_path, manifest)
+
+    pruned = 0
+    if manifest is not None:
+        # Sources that disappeared since the last run leave orphaned outputs behind. Games streamed without a raw
+        # PGN file in the pgn directory were never expected there, so their outputs are not orphaned.
+        for filename in sorted(set(entries) - set(filenames)):
+            if entry_raw_location(entries[filename]) != "pgn":
+                continue
+            remove_output(entries.pop(filename).get("output"))
+            pruned += 1
+        save_manifest(manifest_path, manifest)
+
+    print(f"Summary: converted {converted} of {len(jobs)} files ({len(jobs) - converted} without a valid game), "
+          f"{len(filenames) - len(jobs)} unchanged, {pruned} orphaned outputs pruned")
+    return converted
+
+# Destination of downloaded games that converts each game in memory as it arrives, instead of writing
+# raw PGN files and scanning them again afterwards. Writing the raw PGN is optional:
+#   "files"   - one file per game in the pgn directory, written on a background thread
+#   "archive" - all games of a monthly archive batched into one multi-game file in pgn/archives
+#   "none"    - not kept at all
+# With a store directory, both the raw PGNs and the converted command streams are appended to
+# SegmentStores instead of being written as one file per game. With a GameDatabase, every converted game
+# is loaded into it as well.
+class StreamingConversionSink:
+    def __init__(self, converted_moves_directory, pgn_directory, raw_pgn="files", manifest_path=None, force=False,
+                 store_directory=None, stats=NULL_STATS, checkpoint=NULL_CHECKPOINT, database=None):
+        self.converted_moves_directory = converted_moves_directory
+        self.pgn_directory = pgn_directory
+        self.raw_pgn = "store" if store_directory else raw_pgn
+        self.raw_store = SegmentStore(os.path.join(store_directory, "raw")) if store_directory else None
+        self.converted_store = SegmentStore(os.path.join(store_directory, "converted")) if store_directory else None
+        self.force = force
+        self.stats = stats
+        self.checkpoint = checkpoint
+        self.database = database
+        self.manifest_path = manifest_path
+        self.manifest = load_manifest(manifest_path) if manifest_path else None
+        self.writer = ThreadPoolExecutor(max_workers=1) if self.raw_pgn == "files" else None
+        self.pending_writes = []
+        self.converted = 0
+        self.unchanged = 0
+        if self.raw_pgn == "archive":
+            os.makedirs(os.path.join(pgn_directory, "archives"), exist_ok=True)
+
+    # Outputs kept in the store are recorded in the manifest as "store:<game>"
+    def output_filepath(self, filename):
+        if self.converted_store is not None:
+            return f"store:{filename}"
+        return os.path.join(self.converted_moves_directory, f"converted_{filename}")
+
+    def output_exists(self, output):
+        if output.startswith("store:"):
+            return self.converted_store is not None and output[len("store:"):] in self.converted_store
+        return os.path.exists(output)
+
+    # Cached archives are fed to the sink again when one of their games is missing, was converted by an older
+    # converter or to another storage target, or when every game is converted again
+    def has_game(self, filename):
+        if self.force:
+            return False
+        output_filepath = self.output_filepath(filename)
+        entry = self.manifest["files"].get(filename) if self.manifest is not None else None
+        if entry is not None:
+            return has_current_outputs(entry, output_filepath, self.output_exists)
+        return self.output_exists(output_filepath)
+
+    # Convert every game of an archive. Returns the names of the games it contained. When games are only the
+    # games of the archive that need converting, archived_games holds all of them, so that the raw archive
+    # file still keeps every game.
+    def add_games(self, username, url, games, archived_games=None):
+        games = [game for game in games if 'pgn' in game]
+        archived_games = games if archived_games is None else [game for game in archived_games if 'pgn' in game]
+        if self.raw_pgn == "archive" and archived_games:
+            year, month = url.rstrip("/").split("/")[-2:]
+            archive_path = os.path.join(self.pgn_directory, "archives", f"{username}_{year}_{month}.pgn")
+            with self.stats.timed("disk_write", len(archived_games)):
+                write_text(archive_path, "\n\n".join(game['pgn'].strip() for game in archived_games) + "\n")
+
+        filenames = []
+        for game in games:
+            filename = game_filename(username, game)
+            pgn_data = game['pgn']
+            filenames.append(filename)
+            if self.checkpoint.is_converted(filename):
+                continue
+            if self.writer:
+                self.pending_writes.append(self.writer.submit(self.write_raw_pgn, filename, pgn_data))
+            changed = self.convert(filename, pgn_data)
+            if self.raw_store is not None and (changed or filename not in self.raw_store):
+                with self.stats.timed("disk_write"):
+                    self.raw_store.append(filename, pgn_data)
+            self.checkpoint.game_converted(filename)
+        return filenames
+
+    # Runs on the background writer thread
+    def write_raw_pgn(self, filename, pgn_data):
+        with self.stats.timed("disk_write"):
+            write_text(os.path.join(self.pgn_directory, filename), pgn_data)
+
+    # Returns False if the game was already converted from the same PGN
+    def convert(self, filename, pgn_data):
+        output_filepath = self.output_filepath(filename)
+        fingerprint = {"sha256": hashlib.sha256(pgn_data.encode("utf-8")).hexdigest(), "size": None, "mtime_ns": None}
+        entries = self.manifest["files"] if self.manifest is not None else None
+        if (not self.force and entries is not None and is_up_to_date(entries.get(filename), fingerprint, output_filepath, self.output_exists)
+                and (self.database is None or self.database.has_source(filename, fingerprint["sha256"]))):
+            self.unchanged += 1
+            return False
+
+        converted_moves = convert_game(pgn_data, self.stats)
+        if converted_moves is None:
+            LOGGER.warning("No valid game found in %s", filename)
+        else:
+            if self.converted_store is not None:
+                text = "".join(move + "\n" for move in converted_moves)
+                with self.stats.timed("output_write"):
+                    self.converted_store.append(filename, text)
+                self.stats.add("bytes_out", len(text))
+            else:
+                write_converted_moves(output_filepath, converted_moves, self.stats)
+            self.converted += 1
+        if self.database is not None:
+            with self.stats.timed("database_load"):
+                self.database.add_source(filename, fingerprint["sha256"], [(filename, pgn_data, converted_moves)])
+        if entries is not None:
+            entries[filename] = dict(fingerprint, converter_version=CONVERTER_VERSION,
+                                     output=output_filepath if converted_moves is not None else None)
+            if self.raw_pgn != "files":
+                # Tells convert_directory not to prune the output because the pgn directory has no such file
+                entries[filename]["raw"] = self.raw_pgn
+        return True
+
+    # Checkpoint hook: make everything converted so far durable
+    def flush(self):
+        for write in self.pending_writes:
+            write.result()
+        self.pending_writes = []
+        for store in (self.raw_store, self.converted_store):
+            if store is not None:
+                store.flush()
+        if self.database is not None:
+            self.database.flush()
+        if self.manifest is not None:
+            save_manifest(self.manifest_path, self.manifest)
+
+    def close(self):
+        if self.writer:
+            self.writer.shutdown(wait=True)
+            for write in self.pending_writes:
+                write.result()  # Re-raise any error of the background writes
+        for store in (self.raw_store, self.converted_store):
+            if store is not None:
+                store.close()
+        if self.database is not None:
+            self.database.flush()
+        if self.manifest is not None:
+            save_manifest(self.manifest_path, self.manifest)
+        print(f"Summary: converted {self.converted} games while downloading, {self.unchanged} unchanged")
@@ -0,0 +1,157 @@
+# Position index: the Polyglot Zobrist key of every position of every game in the corpus, so that
+# "which games reached this position?" is a binary search instead of replaying every game
+import json
+import mmap
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+import chess
+import chess.pgn
+import chess.polyglot
+
+from replay_etl.converter import pair_game_outputs
+from replay_etl.extsort import drain_records, external_sort, spill_directory, spill_records
+from replay_etl.util import write_json_atomic
+
+# (Zobrist key, game number, ply), big-endian so that the packed records sort by key, then game, then ply
+RECORD_STRUCT = struct.Struct(">QII")
+
+# Bumped when the record layout changes
+INDEX_FORMAT = 1
+
+# The game ids are kept next to the index, in the order of their game numbers
+def games_path(index_path):
+    return index_path + ".games.json"
+
+# Keys of the positions of every game of a PGN file, ply 0 being the starting position, one game at a time.
+# Games get the ids of their converted outputs: the file name, or numbered names in a multi-game file.
+def position_keys(pgn_filepath):
+    def read_games(pgn_file):
+        while True:
+            game = chess.pgn.read_game(pgn_file)
+            if game is None:
+                return
+            board = game.board()
+            keys = [board.zobrist]
+            for move in game.mainline_moves():
+                board.push(move)
+                keys.append(board.zobrist)
+            yield keys
+
+    with open(pgn_filepath) as pgn_file:
+        yield from pair_game_outputs(read_games(pgn_file), os.path.basename(pgn_filepath))
+
+# Worker entry point: spill the records of a PGN file, numbering its games from 0. job is (pgn file, spill
+# directory). Returns the spilled file and the game ids.
+def spill_position_records(job):
+    pgn_filepath, directory = job
+    game_ids = []
+
+    def records():
+        for game_id, keys in position_keys(pgn_filepath):
+            game_number = len(game_ids)
+            game_ids.append(game_id)
+            for ply, key in enumerate(keys):
+                yield RECORD_STRUCT.pack(key, game_number, ply)
+
+    return spill_records(records(), directory), game_ids
+
+# Index every game of the PGN directory into index_path. Records are sorted with an external sort, and
+# worker processes spill theirs to temporary files, so memory use stays bounded by chunk_records however
+# large the corpus or a single PGN file is.
+def build_position_index(pgn_directory, index_path, workers=1, chunk_records=1000000):
+    pgn_filepaths = [os.path.join(pgn_directory, filename)
+                     for filename in sorted(os.listdir(pgn_directory)) if filename.endswith(".pgn")]
+    game_ids = []
+
+    def records(results):
+        for games in results:
+            for game_id, keys in games:
+                game_number = len(game_ids)
+                game_ids.append(game_id)
+                for ply, key in enumerate(keys):
+                    yield RECORD_STRUCT.pack(key, game_number, ply)
+
+    # Renumber the games of each spilled file after the games of the files before it
+    def spilled_records(results):
+        for path, file_game_ids in results:
+            first_game_number = len(game_ids)
+            game_ids.extend(file_game_ids)
+            for record in drain_records(path, RECORD_STRUCT.size):
+                key, game_number, ply = RECORD_STRUCT.unpack(record)
+                yield RECORD_STRUCT.pack(key, first_game_number + game_number, ply)
+
+    directory = os.path.dirname(index_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if workers > 1 and len(pgn_filepaths) > 1:
+        with spill_directory(directory or None) as spill_path, ProcessPoolExecutor(max_workers=workers) as executor:
+            jobs = [(pgn_filepath, spill_path) for pgn_filepath in pgn_filepaths]
+            results = executor.map(spill_position_records, jobs, chunksize=max(1, len(jobs) // (workers * 4)))
+            positions = external_sort(spilled_records(results), index_path, RECORD_STRUCT.size, chunk_records,
+                                      temp_directory=directory or None)
+    else:
+        positions = external_sort(records(map(position_keys, pgn_filepaths)), index_path, RECORD_STRUCT.size,
+                                  chunk_records, temp_directory=directory or None)
+    write_json_atomic(games_path(index_path), {"format": INDEX_FORMAT, "positions": positions, "games": game_ids})
+    print(f"Indexed {positions} positions of {len(game_ids)} games from {len(pgn_filepaths)} files into {index_path}")
+    return positions
+
+# Read side of the index, memory-mapped like chess.polyglot.MemoryMappedReader
+class PositionIndex:
+    def __init__(self, index_path):
+        with open(games_path(index_path)) as games_file:
+            metadata = json.load(games_file)
+        if metadata.get("format") != INDEX_FORMAT:
+            raise IOError(f"{index_path} was built by another version; build the position index again")
+        self.game_ids = metadata["games"]
+        with open(index_path, "rb") as index_file:
+            try:
+                self.mmap = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                self.mmap = b""  # An empty index cannot be mapped
+        if len(self.mmap) != metadata["positions"] * RECORD_STRUCT.size:
+            raise IOError(f"{index_path} does not match {games_path(index_path)}; build the position index again")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.mmap) // RECORD_STRUCT.size
+
+    def close(self):
+        if isinstance(self.mmap, mmap.mmap):
+            self.mmap.close()
+
+    # Index of the first record with a key not less than key
+    def bisect_key_left(self, key):
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if RECORD_STRUCT.unpack_from(self.mmap, mid * RECORD_STRUCT.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    # Every (game id, ply) that reached the position, whatever the move order. position is a chess.Board,
+    # a FEN or a Zobrist key. Positions match on pieces, side to move, castling rights and a capturable
+    # en passant square, like chess.polyglot; the move counters are ignored.
+    def find(self, position):
+        if isinstance(position, int):
+            key = position
+        else:
+            board = chess.Board(position) if isinstance(position, str) else position
+            key = chess.polyglot.zobrist_hash(board)
+
+        matches = []
+        for index in range(self.bisect_key_left(key), len(self)):
+            record_key, game_number, ply = RECORD_STRUCT.unpack_from(self.mmap, index * RECORD_STRUCT.size)
+            if record_key != key:
+                break
+            matches.append((self.game_ids[game_number], ply))
+        return matches
@@ -0,0 +1,44 @@
+# Shard manifest: splits the converted games into shards of similar replay cost for parallel C# test runs
+import heapq
+import os
+
+from replay_etl.util import write_json_atomic
+
+# Replay cost of a converted file: the number of Command: lines the replay engine has to play
+def count_commands(output_filepath):
+    with open(output_filepath) as output_file:
+        return sum(1 for line in output_file if line.startswith("Command:"))
+
+# Longest-processing-time-first bin packing: hand out the games from most to fewest commands, each to
+# the shard with the fewest commands so far. costs maps a file name to its command count.
+def balance_shards(costs, shard_count):
+    shards = [{"commands": 0, "files": []} for _ in range(shard_count)]
+    # (commands, shard index) so ties go to the lowest shard and the result is the same on every run
+    loads = [(0, index) for index in range(shard_count)]
+    for filename in sorted(costs, key=lambda name: (-costs[name], name)):
+        commands, index = heapq.heappop(loads)
+        shards[index]["files"].append(filename)
+        shards[index]["commands"] += costs[filename]
+        heapq.heappush(loads, (commands + costs[filename], index))
+    return shards
+
+# Split every converted file in the directory into shard_count shards and write the manifest as JSON
+def write_shard_manifest(converted_moves_directory, shard_count, manifest_path):
+    costs = {}
+    for filename in sorted(os.listdir(converted_moves_directory)):
+        if filename.startswith("converted_") and filename.endswith(".pgn"):
+            costs[filename] = count_commands(os.path.join(converted_moves_directory, filename))
+
+    shards = balance_shards(costs, shard_count)
+    write_json_atomic(manifest_path, {
+        "converted_moves_directory": converted_moves_directory,
+        "shard_count": shard_count,
+        "total_commands": sum(costs.values()),
+        "shards": shards,
+    })
+
+    heaviest = max(shard["commands"] for shard in shards)
+    lightest = min(shard["commands"] for shard in shards)
+    print(f"Wrote {shard_count} shards of {len(costs)} games to {manifest_path} "
+          f"({lightest} to {heaviest} commands per shard)")
+    return shards
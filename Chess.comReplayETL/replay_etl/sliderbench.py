@@ -0,0 +1,211 @@
+# Slider attack microbenchmark: the dict-per-square attack tables of the vendored chess package
+# (BB_DIAG_ATTACKS, BB_RANK_ATTACKS, BB_FILE_ATTACKS) against flat magic bitboard tables, on the
+# occupancies of the corpus positions and in legal move generation
+import os
+import time
+
+import chess
+import chess.pgn
+
+# Magic multipliers from a seeded random search, one per square. The index of an occupancy into the
+# square's slice of the flat table is ((occupied & mask) * magic mod 2**64) >> (64 - bits of the mask).
+ROOK_MAGICS = [
+    0x0080004000208014, 0x1140001000402002, 0x0200220008804010, 0xb100100061001994,
+    0x8600020004108821, 0x8500021300080400, 0x0280060001000180, 0xc480003100004080,
+    0x0052801080400020, 0x8014400520100140, 0x0220802000801000, 0x2080801000800800,
+    0x0202002200100804, 0xb002001002000408, 0xa069800900802200, 0xa002000084004102,
+    0x0400828000400020, 0x3000444000201002, 0x032004401001c800, 0x0219010008100020,
+    0x0214050008010010, 0x2002008080040002, 0x7440c40001081002, 0x0400020001008064,
+    0x0a40400880208000, 0x0020500040002004, 0x1a71300180200080, 0x8100100080080080,
+    0x2000080080040080, 0x2010020080040080, 0x0008820400900108, 0x1000852200104284,
+    0x00c0084084800022, 0x0000402001401000, 0x8001002005004010, 0x44c5001001000820,
+    0x4000040080800801, 0x11c8104008010420, 0x0040010804008210, 0x4004008122001044,
+    0x1000400080208003, 0x4000201000444000, 0x0022002080120040, 0x0009001000210008,
+    0x0805001008010004, 0x0000040002008080, 0x8003000200010004, 0x40210004a041000a,
+    0x0000208000401080, 0x90c4400090210100, 0x0404200010008480, 0x0420100080080280,
+    0x1000040180080180, 0x0010020004008080, 0x0020100108020400, 0x0020044400a50600,
+    0x1102008020481102, 0x0004400021041481, 0x431880104200210a, 0x8e00050020081001,
+    0x3012008810200502, 0x1001000208040001, 0x001050083208910c, 0x000090c425098406,
+]
+BISHOP_MAGICS = [
+    0x040c04100e020818, 0x0528106424802800, 0x0010108081080000, 0x0044041084040102,
+    0x0204242010208085, 0x0882010520080008, 0x0001010121204000, 0x0100220110211001,
+    0x0800400208024084, 0x0800081000809101, 0x4004220220420000, 0x0585440502108008,
+    0x0008042c20000010, 0x12a244c410402020, 0x0004005208208806, 0x2080404100901002,
+    0x80848008205c1402, 0x0010000210412900, 0x2c080a1008302220, 0x0800844802004024,
+    0x0604030284a00004, 0x0c09000a00420201, 0x02704a0401185814, 0x1002000104a08400,
+    0x0004e08004604400, 0xc010100042040108, 0x810198041000a020, 0x2040240022410060,
+    0x8860840080802000, 0x0021210008088800, 0x2804008000480400, 0x7004008401088080,
+    0x888a6091005c1000, 0x6006125000210108, 0x2004084102080600, 0x0000100820040400,
+    0x2640010804450040, 0x2021120602008800, 0x000148008a020202, 0x4008024440010520,
+    0x0204040440010404, 0xa034008808208480, 0x00008402c8000900, 0x0000398401001020,
+    0x0400e00204102080, 0x20e2181001000021, 0x000404180204b040, 0x060200820080c618,
+    0x1608880802100082, 0x0841840c050c8a01, 0x2060004404040008, 0x0081000042020040,
+    0x408008c002822020, 0x4000401468088401, 0x0042048830830008, 0x9010100200405410,
+    0x0043010801018840, 0x0080310848240440, 0x0101000209008821, 0x000c040400420225,
+    0x2280018240428200, 0x0490c00420240101, 0x0482401081022086, 0x0040840414802304,
+]
+
+ROOK_MASKS = [chess.BB_RANK_MASKS[square] | chess.BB_FILE_MASKS[square] for square in chess.SQUARES]
+
+# Flat table of one slider: a list of every attack set, square after square, with the offset and shift
+# of each square. attacks(square, subset) gives the attacks for the blockers in subset.
+def magic_table(masks, magics, attacks):
+    table, offsets, shifts = [], [], []
+    for square in chess.SQUARES:
+        mask, magic = masks[square], magics[square]
+        shift = 64 - bin(mask).count("1")
+        entries = [None] * (1 << (64 - shift))
+        subset = 0
+        while True:  # Carry-Rippler over the subsets of the mask
+            index = ((subset * magic) & chess.BB_ALL) >> shift
+            subset_attacks = attacks(square, subset)
+            if entries[index] is not None and entries[index] != subset_attacks:
+                raise ValueError(f"Magic {magic:#x} of {chess.SQUARE_NAMES[square]} maps two attack sets to one index")
+            entries[index] = subset_attacks
+            subset = (subset - mask) & mask
+            if not subset:
+                break
+        offsets.append(len(table))
+        shifts.append(shift)
+        table.extend(entries)
+    return table, offsets, shifts
+
+# Filled by build_magic_tables, which takes about a second, so that importing this module stays cheap
+ROOK_TABLE, ROOK_OFFSETS, ROOK_SHIFTS = [], [], []
+BISHOP_TABLE, BISHOP_OFFSETS, BISHOP_SHIFTS = [], [], []
+
+def build_magic_tables():
+    if ROOK_TABLE:
+        return
+    table, offsets, shifts = magic_table(
+        ROOK_MASKS, ROOK_MAGICS,
+        lambda square, subset: (chess.BB_RANK_ATTACKS[square][subset & chess.BB_RANK_MASKS[square]] |
+                                chess.BB_FILE_ATTACKS[square][subset & chess.BB_FILE_MASKS[square]]))
+    ROOK_TABLE.extend(table)
+    ROOK_OFFSETS.extend(offsets)
+    ROOK_SHIFTS.extend(shifts)
+    table, offsets, shifts = magic_table(chess.BB_DIAG_MASKS, BISHOP_MAGICS,
+                                         lambda square, subset: chess.BB_DIAG_ATTACKS[square][subset])
+    BISHOP_TABLE.extend(table)
+    BISHOP_OFFSETS.extend(offsets)
+    BISHOP_SHIFTS.extend(shifts)
+
+def rook_attacks(square, occupied):
+    return ROOK_TABLE[ROOK_OFFSETS[square] + (((occupied & ROOK_MASKS[square]) * ROOK_MAGICS[square] & chess.BB_ALL) >> ROOK_SHIFTS[square])]
+
+def bishop_attacks(square, occupied):
+    return BISHOP_TABLE[BISHOP_OFFSETS[square] + (((occupied & chess.BB_DIAG_MASKS[square]) * BISHOP_MAGICS[square] & chess.BB_ALL) >> BISHOP_SHIFTS[square])]
+
+# chess.Board with the slider lookups of attacks_mask and attackers_mask on the magic tables, which are
+# what move generation and check detection go through
+class MagicBoard(chess.Board):
+    def attacks_mask(self, square):
+        bb_square = chess.BB_SQUARES[square]
+        if bb_square & self.pawns:
+            return chess.BB_PAWN_ATTACKS[bool(bb_square & self.occupied_co[chess.WHITE])][square]
+        elif bb_square & self.knights:
+            return chess.BB_KNIGHT_ATTACKS[square]
+        elif bb_square & self.kings:
+            return chess.BB_KING_ATTACKS[square]
+        attacks = 0
+        if bb_square & self.bishops or bb_square & self.queens:
+            attacks = bishop_attacks(square, self.occupied)
+        if bb_square & self.rooks or bb_square & self.queens:
+            attacks |= rook_attacks(square, self.occupied)
+        return attacks
+
+    def attackers_mask(self, color, square, occupied=None):
+        occupied = self.occupied if occupied is None else occupied
+        attackers = ((chess.BB_KING_ATTACKS[square] & self.kings) |
+                     (chess.BB_KNIGHT_ATTACKS[square] & self.knights) |
+                     (rook_attacks(square, occupied) & (self.queens | self.rooks)) |
+                     (bishop_attacks(square, occupied) & (self.queens | self.bishops)) |
+                     (chess.BB_PAWN_ATTACKS[not color][square] & self.pawns))
+        return attackers & self.occupied_co[color]
+
+# FEN of every position of the mainlines of the PGN directory
+def corpus_fens(pgn_directory):
+    fens = []
+    for filename in sorted(os.listdir(pgn_directory)):
+        if not filename.endswith(".pgn"):
+            continue
+        with open(os.path.join(pgn_directory, filename)) as pgn_file:
+            while True:
+                game = chess.pgn.read_game(pgn_file)
+                if game is None:
+                    break
+                board = game.board()
+                if type(board) is not chess.Board:
+                    continue
+                for move in game.mainline_moves():
+                    board.push(move)
+                    fens.append(board.fen())
+    return fens
+
+def elapsed(run):
+    start = time.perf_counter()
+    run()
+    return time.perf_counter() - start
+
+# Time the rook and bishop lookups of both layouts on every slider of every corpus position, then legal move
+# generation of every position with chess.Board and MagicBoard. Both layouts are checked to agree first.
+# Runs alternate between the layouts, so that a busy machine slows both alike. Returns the timings.
+def benchmark_sliders(pgn_directory, repeat=5):
+    build_magic_tables()
+    fens = corpus_fens(pgn_directory)
+    rook_squares, bishop_squares = [], []
+    for fen in fens:
+        board = chess.Board(fen)
+        rook_squares.extend((square, board.occupied) for square in chess.scan_forward(board.rooks | board.queens))
+        bishop_squares.extend((square, board.occupied) for square in chess.scan_forward(board.bishops | board.queens))
+    boards = [chess.Board(fen) for fen in fens]
+    magic_boards = [MagicBoard(fen) for fen in fens]
+
+    for square, occupied in rook_squares:
+        if rook_attacks(square, occupied) != (chess.BB_RANK_ATTACKS[square][chess.BB_RANK_MASKS[square] & occupied] |
+                                              chess.BB_FILE_ATTACKS[square][chess.BB_FILE_MASKS[square] & occupied]):
+            raise ValueError(f"Magic rook attacks of {chess.SQUARE_NAMES[square]} differ for occupancy {occupied:#x}")
+    for square, occupied in bishop_squares:
+        if bishop_attacks(square, occupied) != chess.BB_DIAG_ATTACKS[square][chess.BB_DIAG_MASKS[square] & occupied]:
+            raise ValueError(f"Magic bishop attacks of {chess.SQUARE_NAMES[square]} differ for occupancy {occupied:#x}")
+    for board, magic_board in zip(boards, magic_boards):
+        if list(board.generate_legal_moves()) != list(magic_board.generate_legal_moves()):
+            raise ValueError(f"Move generation with the magic tables differs in {board.fen()}")
+
+    # The lookups are written out inline, like the library does, so that no call overhead is timed
+    def rook_dict():
+        for square, occupied in rook_squares:
+            chess.BB_RANK_ATTACKS[square][chess.BB_RANK_MASKS[square] & occupied] | chess.BB_FILE_ATTACKS[square][chess.BB_FILE_MASKS[square] & occupied]
+
+    def rook_magic():
+        for square, occupied in rook_squares:
+            ROOK_TABLE[ROOK_OFFSETS[square] + (((occupied & ROOK_MASKS[square]) * ROOK_MAGICS[square] & chess.BB_ALL) >> ROOK_SHIFTS[square])]
+
+    def bishop_dict():
+        for square, occupied in bishop_squares:
+            chess.BB_DIAG_ATTACKS[square][chess.BB_DIAG_MASKS[square] & occupied]
+
+    def bishop_magic():
+        for square, occupied in bishop_squares:
+            BISHOP_TABLE[BISHOP_OFFSETS[square] + (((occupied & chess.BB_DIAG_MASKS[square]) * BISHOP_MAGICS[square] & chess.BB_ALL) >> BISHOP_SHIFTS[square])]
+
+    def legal_moves(boards):
+        return lambda: [list(board.generate_legal_moves()) for board in boards]
+
+    benchmarks = [
+        ("rook lookups", len(rook_squares), rook_dict, rook_magic),
+        ("bishop lookups", len(bishop_squares), bishop_dict, bishop_magic),
+        ("legal moves", len(boards), legal_moves(boards), legal_moves(magic_boards)),
+    ]
+    timings = {}
+    for name, count, dict_run, magic_run in benchmarks:
+        dict_times, magic_times = [], []
+        for _ in range(repeat):
+            dict_times.append(elapsed(dict_run))
+            magic_times.append(elapsed(magic_run))
+        dict_best, magic_best = min(dict_times), min(magic_times)
+        timings[name] = {"dict": dict_best, "magic": magic_best}
+        print(f"{name:>14}: dict {count / dict_best:12.0f}/sec, magic {count / magic_best:12.0f}/sec, "
+              f"magic speedup {dict_best / magic_best:.2f}x ({count} items, best of {repeat})")
+    return timings
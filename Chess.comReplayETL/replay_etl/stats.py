@@ -0,0 +1,88 @@
+# Run statistics: wall time and counts per ETL stage plus throughput counters, reported as JSON
+import contextlib
+import json
+import threading
+import time
+
+# Stages in the order the data flows through them
+STAGES = ("http_fetch", "disk_write", "pgn_parse", "conversion", "output_write", "database_load")
+
+# Collects per-stage timings and counters. Stage times are summed over all threads and worker
+# processes, so with parallelism they can add up to more than the wall time of the run.
+class RunStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {stage: [0.0, 0] for stage in STAGES}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds, count=1):
+        with self.lock:
+            totals = self.stages.setdefault(stage, [0.0, 0])
+            totals[0] += seconds
+            totals[1] += count
+
+    def add(self, counter, value=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    @contextlib.contextmanager
+    def timed(self, stage, count=1):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, count)
+
+    # Plain data that can be sent back from a worker process and merged into the parent's stats
+    def to_dict(self):
+        with self.lock:
+            return {"stages": {stage: list(totals) for stage, totals in self.stages.items()}, "counters": dict(self.counters)}
+
+    def merge(self, data):
+        for stage, (seconds, count) in data["stages"].items():
+            if count:
+                self.record(stage, seconds, count)
+        for counter, value in data["counters"].items():
+            self.add(counter, value)
+
+    def report(self):
+        wall_seconds = time.perf_counter() - self.started
+        with self.lock:
+            stages = {stage: {"seconds": round(seconds, 6), "count": count} for stage, (seconds, count) in self.stages.items()}
+            counters = dict(self.counters)
+            converting_seconds = self.stages["pgn_parse"][0] + self.stages["conversion"][0]
+        return {
+            "wall_seconds": round(wall_seconds, 6),
+            "stages": stages,
+            "counters": counters,
+            "games_per_second": round(counters.get("games", 0) / wall_seconds, 3) if wall_seconds else None,
+            "moves_per_second": round(counters.get("moves", 0) / wall_seconds, 3) if wall_seconds else None,
+            # Throughput of parsing plus conversion alone, without I/O
+            "converter_games_per_second": round(counters.get("games", 0) / converting_seconds, 3) if converting_seconds else None,
+        }
+
+    # Write the report to a file, or to stdout for "-"
+    def write_report(self, path):
+        report = json.dumps(self.report(), indent=2, sort_keys=True)
+        if path == "-":
+            print(report)
+        else:
+            with open(path, "w") as report_file:
+                report_file.write(report + "\n")
+
+# Stand-in for callers that do not collect statistics
+class NullStats:
+    def record(self, stage, seconds, count=1):
+        pass
+
+    def add(self, counter, value=1):
+        pass
+
+    def timed(self, stage, count=1):
+        return contextlib.nullcontext()
+
+    def merge(self, data):
+        pass
+
+NULL_STATS = NullStats()
@@ -0,0 +1,104 @@
+# Append-only segment store for raw PGNs and converted command streams
+import mmap
+import os
+
+from replay_etl.util import write_text
+
+# Append-only store for many small documents (raw PGNs or converted command streams). Documents are
+# appended to segment files, and index.tsv maps each game id to (segment, offset, length), so a game is
+# read back with one slice of a memory-mapped segment instead of opening a file per game.
+# Storing a game id again appends a new copy; the index keeps the latest one.
+class SegmentStore:
+    def __init__(self, directory, segment_size=64 * 1024 * 1024):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.index_path = os.path.join(directory, "index.tsv")
+        os.makedirs(directory, exist_ok=True)
+
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as index_file:
+                lines = index_file.read().split("\n")
+            # A crash in the middle of a flush can leave a partial last line; drop it, so that the next
+            # flush does not append to it
+            if lines[-1]:
+                write_text(self.index_path, "".join(line + "\n" for line in lines[:-1]))
+            for line in lines[:-1]:
+                game_id, segment, offset, length = line.split("\t")
+                self.index[game_id] = (int(segment), int(offset), int(length))
+
+        segments = sorted(int(name[8:13]) for name in os.listdir(directory) if name.startswith("segment-"))
+        self.segment = segments[-1] if segments else 0
+        self.segment_file = None
+        self.pending_index = []
+        self.mapped = {}
+
+    def segment_path(self, segment):
+        return os.path.join(self.directory, f"segment-{segment:05d}.dat")
+
+    def __contains__(self, game_id):
+        return game_id in self.index
+
+    def ids(self):
+        return sorted(self.index)
+
+    def append(self, game_id, text):
+        data = text.encode("utf-8")
+        if self.segment_file is None:
+            self.segment_file = open(self.segment_path(self.segment), "ab")
+        offset = self.segment_file.tell()
+        if offset and offset + len(data) > self.segment_size:
+            self.segment_file.close()
+            self.segment += 1
+            self.segment_file = open(self.segment_path(self.segment), "ab")
+            offset = 0
+        self.segment_file.write(data)
+        self.index[game_id] = (self.segment, offset, len(data))
+        self.pending_index.append(f"{game_id}\t{self.segment}\t{offset}\t{len(data)}\n")
+
+    def get(self, game_id):
+        segment, offset, length = self.index[game_id]
+        if self.pending_index:
+            self.flush()
+        mapped = self.mapped.get(segment)
+        if mapped is None or len(mapped) < offset + length:
+            # Map the segment again when it grew since it was mapped
+            if mapped is not None:
+                mapped.close()
+            with open(self.segment_path(segment), "rb") as segment_file:
+                mapped = self.mapped[segment] = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return mapped[offset:offset + length].decode("utf-8")
+
+    # The index lines are only written after the data they point to, so a crash can lose the last
+    # games but never leaves index entries pointing past the end of a segment
+    def flush(self):
+        if self.segment_file is not None:
+            self.segment_file.flush()
+        if self.pending_index:
+            with open(self.index_path, "a") as index_file:
+                index_file.writelines(self.pending_index)
+            self.pending_index = []
+
+    def close(self):
+        self.flush()
+        if self.segment_file is not None:
+            self.segment_file.close()
+            self.segment_file = None
+        for mapped in self.mapped.values():
+            mapped.close()
+        self.mapped = {}
+
+# Materialise the per-file layout (pgn/<game>.pgn and converted_moves/converted_<game>.pgn) that the
+# C# replay tests read, from a store written by --storage store
+def export_store(store_directory, pgn_directory, converted_moves_directory):
+    os.makedirs(pgn_directory, exist_ok=True)
+    os.makedirs(converted_moves_directory, exist_ok=True)
+    exported = 0
+    for kind, directory, prefix in (("raw", pgn_directory, ""), ("converted", converted_moves_directory, "converted_")):
+        store = SegmentStore(os.path.join(store_directory, kind))
+        for game_id in store.ids():
+            write_text(os.path.join(directory, f"{prefix}{game_id}"), store.get(game_id))
+            exported += 1
+        store.close()
+    print(f"Exported {exported} files from {store_directory}")
+    return exported
@@ -0,0 +1,39 @@
+# Small file helpers shared by the ETL stages
+import json
+import logging
+import os
+
+LOG_FORMAT = "%(levelname)s %(name)s: %(message)s"
+
+# Also used as the initializer of worker processes, which do not inherit the logging setup on Windows
+def configure_logging(level):
+    logging.basicConfig(level=level, format=LOG_FORMAT)
+
+# Load the configuration from the JSON file
+def load_config(config_path="etl_config.json"):
+    with open(config_path) as config_file:
+        return json.load(config_file)
+
+# Written to a temp file and renamed into place, so a crash or a full disk never leaves a partial file behind
+def write_text(path, text):
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as text_file:
+        text_file.write(text)
+    os.replace(temp_path, path)
+
+# Remove the temp files of writes that were interrupted by a crash
+def remove_temp_files(directory):
+    for filename in os.listdir(directory):
+        if filename.endswith(".tmp"):
+            os.remove(os.path.join(directory, filename))
+
+# Write to a temp file first so a crash never leaves a truncated file behind
+def write_json_atomic(path, data):
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as json_file:
+        json.dump(data, json_file, indent=2, sort_keys=True)
+    os.replace(temp_path, path)
+
+# Name of the raw PGN file of a game, which also identifies the game in the cache and the manifest
+def game_filename(username, game):
+    return f"{username}_game_{game['end_time']}.pgn"
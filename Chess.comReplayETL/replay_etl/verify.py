@@ -0,0 +1,213 @@
+# Verification stage: decodes the Command: lines of converted games back into moves, replays them on
+# chess.Board and compares the result with the PGN mainline and its CurrentPosition header
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import chess
+import chess.pgn
+
+from replay_etl.converter import STARTING_LABELS, append_outcome, numbered_output_filepath, pair_game_outputs
+
+# Piece types of the letter that follows a promotion command (K is a knight, as in the replay engine)
+PROMOTION_PIECES = {"Q": chess.QUEEN, "R": chess.ROOK, "B": chess.BISHOP, "K": chess.KNIGHT}
+
+# First ID the replay engine gives a promoted piece of each type
+FIRST_PROMOTION_IDS = {chess.QUEEN: 2, chess.ROOK: 3, chess.BISHOP: 3, chess.KNIGHT: 3}
+
+# Raised when the commands of a game cannot be decoded into the moves of its PGN
+class VerificationError(Exception):
+    pass
+
+# Piece labels as the replay engine sees them. Deliberately separate from the converter's PieceTracker,
+# so that a tracking bug in the converter shows up here instead of being decoded the same wrong way.
+class ReplayLabels:
+    def __init__(self, board):
+        starting_board = chess.Board()
+        self.squares = {}
+        for square, label in STARTING_LABELS.items():
+            if board.piece_at(square) == starting_board.piece_at(square):
+                self.squares[label] = square
+        self.promotion_ids = {(color, piece_type): first_id for color in chess.COLORS
+                              for piece_type, first_id in FIRST_PROMOTION_IDS.items()}
+
+    def label_at(self, square):
+        for label, label_square in self.squares.items():
+            if label_square == square:
+                return label
+        return None
+
+    def remove(self, square):
+        label = self.label_at(square)
+        if label is not None:
+            del self.squares[label]
+
+    # Must be called with the board before board.push(move)
+    def push(self, board, move):
+        label = self.label_at(move.from_square)
+        if board.is_castling(move):
+            rook_file = 7 if board.is_kingside_castling(move) else 0
+            rank = chess.square_rank(move.from_square)
+            rook_label = self.label_at(chess.square(rook_file, rank))
+            self.squares[label] = move.to_square
+            if rook_label is not None:
+                self.squares[rook_label] = chess.square(5 if rook_file == 7 else 3, rank)
+            return
+
+        if board.is_en_passant(move):
+            self.remove(chess.square(chess.square_file(move.to_square), chess.square_rank(move.from_square)))
+        else:
+            self.remove(move.to_square)
+
+        if label is not None:
+            del self.squares[label]
+        if move.promotion:
+            key = (board.turn, move.promotion)
+            prefix = "W" if board.turn == chess.WHITE else "B"
+            letter = next(letter for letter, piece_type in PROMOTION_PIECES.items() if piece_type == move.promotion)
+            self.squares[f"{prefix}{letter}{self.promotion_ids[key]}"] = move.to_square
+            self.promotion_ids[key] += 1
+        elif label is not None:
+            self.squares[label] = move.to_square
+
+# Decode the command at commands[index] (and the promotion letter after it) into a legal move.
+# Returns the move and the index of the next command.
+def decode_move(board, labels, commands, index):
+    if index >= len(commands):
+        raise VerificationError("the commands end before the game does")
+    command = commands[index]
+    parts = command.split()
+    if len(parts) != 2 or parts[0] not in labels.squares:
+        raise VerificationError(f"command {command!r} does not name a piece on the board")
+    from_square = labels.squares[parts[0]]
+    try:
+        to_square = chess.parse_square(parts[1].lower())
+    except ValueError:
+        raise VerificationError(f"command {command!r} does not name a square")
+    index += 1
+
+    promotion = None
+    moving_piece = board.piece_at(from_square)
+    target_piece = board.piece_at(to_square)
+    onto_own_rook = (moving_piece is not None and moving_piece.piece_type == chess.KING and target_piece is not None
+                     and target_piece.color == moving_piece.color and target_piece.piece_type == chess.ROOK)
+    if onto_own_rook:
+        # The replay engine castles by moving the king onto its own rook
+        to_file = 6 if chess.square_file(to_square) > chess.square_file(from_square) else 2
+        to_square = chess.square(to_file, chess.square_rank(from_square))
+    elif (moving_piece is not None and moving_piece.piece_type == chess.PAWN
+            and chess.square_rank(to_square) in (0, 7)):
+        if index >= len(commands) or commands[index] not in PROMOTION_PIECES:
+            raise VerificationError(f"promotion {command!r} is not followed by a piece letter")
+        promotion = PROMOTION_PIECES[commands[index]]
+        index += 1
+
+    move = chess.Move(from_square, to_square, promotion)
+    if not board.is_legal(move):
+        raise VerificationError(f"command {command!r} decodes to the illegal move {move.uci()}")
+    if board.is_castling(move) and not onto_own_rook:
+        raise VerificationError(f"command {command!r} castles without moving the king onto its rook")
+    return move, index
+
+# Name a ply the way a reader finds it in the PGN, e.g. "ply 23 (12. Nf3)"
+def describe_ply(board, ply, move):
+    number = f"{board.fullmove_number}." if board.turn == chess.WHITE else f"{board.fullmove_number}..."
+    return f"ply {ply} ({number} {board.san(move)})"
+
+# Fields of a FEN that CurrentPosition carries: placement, turn, castling rights and en passant square.
+# chess.com usually writes "-" for the en passant square, so it is only compared when a square is given.
+def position_fields(fen, en_passant=True):
+    fields = fen.split()[:4]
+    return fields if en_passant else fields[:3]
+
+# Replay the converted commands of one game against its PGN. Returns None if the commands reproduce the
+# mainline, the outcome and the CurrentPosition header, otherwise a description of the first divergence.
+def verify_game(pgn_text, converted_text):
+    game = chess.pgn.read_game(io.StringIO(pgn_text))
+    if game is None:
+        return "the PGN holds no game"
+    return verify_parsed_game(game, converted_text)
+
+# Same as verify_game, for a game already parsed with chess.pgn.read_game
+def verify_parsed_game(game, converted_text):
+    lines = converted_text.splitlines()
+    commands = [line[len("Command: "):].strip() for line in lines if line.startswith("Command: ")]
+    outcomes = [line for line in lines if line.startswith("Outcome: ")]
+
+    board = game.board()
+    labels = ReplayLabels(board)
+    index = 0
+    for ply, expected in enumerate(game.mainline_moves(), 1):
+        try:
+            move, index = decode_move(board, labels, commands, index)
+        except VerificationError as error:
+            return f"{describe_ply(board, ply, expected)}: {error}"
+        if move != expected:
+            return f"{describe_ply(board, ply, expected)}: the commands play {board.san(move)} instead"
+        labels.push(board, move)
+        board.push(move)
+
+    # What is left must be the resignation commands and the outcome
+    expected_tail = []
+    append_outcome(board, game.headers.get("Result", "Unknown"), expected_tail)
+    tail = [f"Command: {command}" for command in commands[index:]] + outcomes
+    if tail != expected_tail:
+        return f"after ply {len(board.move_stack)}: expected {expected_tail} after the last move, found {tail}"
+
+    current_position = game.headers.get("CurrentPosition")
+    if current_position is not None:
+        replayed = board.fen(en_passant="fen")
+        en_passant = position_fields(current_position)[3:] != ["-"]
+        if position_fields(replayed, en_passant) != position_fields(current_position, en_passant):
+            return (f"after ply {len(board.move_stack)}: the replayed position {' '.join(position_fields(replayed))} "
+                    f"does not match CurrentPosition {current_position}")
+    return None
+
+# Parse the games of an open PGN file one at a time
+def iter_games(pgn_file):
+    while True:
+        game = chess.pgn.read_game(pgn_file)
+        if game is None:
+            return
+        yield game
+
+# Worker entry point: must live at module level so it can be pickled to the process pool.
+# Verifies every game of a PGN file against its output file and returns the (output file, divergence) failures.
+def verify_job(job):
+    pgn_filepath, output_filepath = job
+    failures = []
+    with open(pgn_filepath) as pgn_file:
+        for game_output_filepath, game in pair_game_outputs(iter_games(pgn_file), output_filepath):
+            if not os.path.exists(game_output_filepath):
+                failures.append((game_output_filepath, "the converted file is missing"))
+                continue
+            with open(game_output_filepath) as output_file:
+                result = verify_parsed_game(game, output_file.read())
+            if result is not None:
+                failures.append((game_output_filepath, result))
+    return failures
+
+# Verify every converted file that has its PGN next to it, optionally over a pool of worker processes.
+# Returns a dict of the failing output files and their first divergence.
+def verify_corpus(pgn_directory, converted_moves_directory, workers=1):
+    jobs = []
+    for filename in sorted(os.listdir(pgn_directory)):
+        output_filepath = os.path.join(converted_moves_directory, f"converted_{filename}")
+        if filename.endswith(".pgn") and (os.path.exists(output_filepath)
+                                          or os.path.exists(numbered_output_filepath(output_filepath, 1))):
+            jobs.append((os.path.join(pgn_directory, filename), output_filepath))
+
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(verify_job, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    else:
+        results = [verify_job(job) for job in jobs]
+
+    failures = {}
+    for job_failures in results:
+        for output_filepath, result in job_failures:
+            failures[output_filepath] = result
+            print(f"VERIFY FAILED: {output_filepath}: {result}")
+
+    print(f"Verified {len(jobs)} files: {len(failures)} failures")
+    return failures
@@ -0,0 +1,28 @@
+# Byte-identical conversion of the checked-in corpus
+import contextlib
+import io
+import os
+import unittest
+
+from replay_etl.pipeline import check_converted_corpus
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PGN_DIRECTORY = os.path.join(ROOT_DIRECTORY, "pgn")
+CONVERTED_MOVES_DIRECTORY = os.path.join(ROOT_DIRECTORY, "converted_moves")
+
+
+class ConvertedCorpusTest(unittest.TestCase):
+    def test_checked_in_outputs_are_reproduced(self):
+        self.assertTrue(os.listdir(CONVERTED_MOVES_DIRECTORY))
+        with contextlib.redirect_stdout(io.StringIO()):
+            mismatches = check_converted_corpus(PGN_DIRECTORY, CONVERTED_MOVES_DIRECTORY)
+        self.assertEqual(mismatches, [])
+
+    def test_every_checked_in_game_has_an_output(self):
+        for filename in os.listdir(PGN_DIRECTORY):
+            if filename.endswith(".pgn"):
+                self.assertTrue(os.path.exists(os.path.join(CONVERTED_MOVES_DIRECTORY, f"converted_{filename}")), filename)
+
+
+if __name__ == "__main__":
+    unittest.main()
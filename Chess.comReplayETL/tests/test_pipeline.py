@@ -0,0 +1,115 @@
+# Manifest sharing between --stream runs and conversions of the pgn directory, and raw archives of --stream
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from replay_etl.fetch import ArchiveCache, restore_missing_games
+from replay_etl.pipeline import StreamingConversionSink, convert_directory
+
+PGN_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pgn")
+
+
+# Games of the checked-in corpus, streamed into a sink over a temporary directory
+class StreamingSinkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.pgn_directory = os.path.join(self.directory, "pgn")
+        self.converted_moves_directory = os.path.join(self.directory, "converted_moves")
+        self.manifest_path = os.path.join(self.directory, "etl_manifest.json")
+        os.makedirs(self.pgn_directory)
+        os.makedirs(self.converted_moves_directory)
+
+        filenames = sorted(filename for filename in os.listdir(PGN_DIRECTORY) if filename.endswith(".pgn"))[:3]
+        self.games = []
+        for filename in filenames:
+            with open(os.path.join(PGN_DIRECTORY, filename)) as pgn_file:
+                self.games.append({"pgn": pgn_file.read(), "end_time": filename.rsplit("_", 1)[1][:-len(".pgn")]})
+
+    def stream(self, raw_pgn):
+        sink = StreamingConversionSink(self.converted_moves_directory, self.pgn_directory, raw_pgn=raw_pgn,
+                                       manifest_path=self.manifest_path)
+        filenames = sink.add_games("player", "https://api.chess.com/pub/player/player/games/2024/07", self.games)
+        sink.close()
+        return [os.path.join(self.converted_moves_directory, f"converted_{filename}") for filename in filenames]
+
+
+class StreamThenConvertDirectoryTest(StreamingSinkTestCase):
+    def assert_outputs_kept(self, raw_pgn):
+        outputs = self.stream(raw_pgn)
+        self.assertTrue(all(os.path.exists(output) for output in outputs))
+
+        convert_directory(self.pgn_directory, self.converted_moves_directory, manifest_path=self.manifest_path)
+        self.assertTrue(all(os.path.exists(output) for output in outputs))
+
+    def test_raw_pgn_none_outputs_survive(self):
+        self.assert_outputs_kept("none")
+
+    def test_raw_pgn_archive_outputs_survive(self):
+        self.assert_outputs_kept("archive")
+
+    def test_raw_pgn_files_are_converted_in_place(self):
+        outputs = self.stream("files")
+        for filename in os.listdir(self.pgn_directory):
+            os.remove(os.path.join(self.pgn_directory, filename))
+
+        # Without their raw PGN files the outputs are orphaned
+        convert_directory(self.pgn_directory, self.converted_moves_directory, manifest_path=self.manifest_path)
+        self.assertFalse(any(os.path.exists(output) for output in outputs))
+
+
+class StorageTargetTest(StreamingSinkTestCase):
+    def test_games_converted_to_files_are_missing_from_the_store(self):
+        outputs = self.stream("files")
+        filename = os.path.basename(outputs[0])[len("converted_"):]
+
+        files_sink = StreamingConversionSink(self.converted_moves_directory, self.pgn_directory, manifest_path=self.manifest_path)
+        self.assertTrue(files_sink.has_game(filename))
+        files_sink.close()
+
+        store_sink = StreamingConversionSink(self.converted_moves_directory, self.pgn_directory, manifest_path=self.manifest_path,
+                                             store_directory=os.path.join(self.directory, "store"))
+        self.assertFalse(store_sink.has_game(filename))
+        store_sink.close()
+
+    def test_force_converts_every_game_again(self):
+        outputs = self.stream("files")
+        sink = StreamingConversionSink(self.converted_moves_directory, self.pgn_directory, manifest_path=self.manifest_path,
+                                       force=True)
+        self.assertFalse(sink.has_game(os.path.basename(outputs[0])[len("converted_"):]))
+        sink.close()
+
+
+# The parts of a requests.Response that ArchiveCache.store reads
+class CachedResponse:
+    def __init__(self, games):
+        self.content = json.dumps({"games": games}).encode("utf-8")
+        self.headers = {}
+
+
+class RestoreArchiveTest(StreamingSinkTestCase):
+    URL = "https://api.chess.com/pub/player/player/games/2024/07"
+
+    def test_restoring_some_games_keeps_the_whole_archive(self):
+        outputs = self.stream("archive")
+        cache = ArchiveCache(os.path.join(self.directory, "http_cache"))
+        cache.store(self.URL, CachedResponse(self.games), [os.path.basename(output)[len("converted_"):] for output in outputs])
+        os.remove(outputs[0])
+
+        sink = StreamingConversionSink(self.converted_moves_directory, self.pgn_directory, raw_pgn="archive",
+                                       manifest_path=self.manifest_path)
+        restored = restore_missing_games(cache, self.URL, "player", sink)
+        sink.close()
+
+        self.assertEqual(restored, 1)
+        self.assertTrue(os.path.exists(outputs[0]))
+        with open(os.path.join(self.pgn_directory, "archives", "player_2024_07.pgn")) as archive_file:
+            archive = archive_file.read()
+        for game in self.games:
+            self.assertIn(game["pgn"].strip(), archive)
+
+
+if __name__ == "__main__":
+    unittest.main()
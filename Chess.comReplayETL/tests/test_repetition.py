@@ -0,0 +1,117 @@
+# Repetition checks of the vendored chess package: once can_claim_threefold_repetition started counting
+# positions in push and pop, its answers and those of is_repetition must match a board that replays its stack
+import random
+import unittest
+
+import chess
+import chess.variant
+
+# Knights going out and back: the starting position occurs again every 4 plies
+KNIGHT_SHUFFLE = ["g1f3", "g8f6", "f3g1", "f6g8"]
+
+
+# The same position and move stack, on a board that never counted positions
+def replayed(board):
+    root = board.root()
+    fresh = type(board)(root.fen(), chess960=board.chess960)
+    for move in board.move_stack:
+        fresh.push(move)
+    return fresh
+
+
+# Random moves that often undo the move before last, so that positions repeat
+def play_random_moves(board, rng, plies):
+    for _ in range(plies):
+        moves = list(board.legal_moves)
+        if not moves or board.is_variant_end():
+            return
+        move = rng.choice(moves)
+        if len(board.move_stack) >= 2 and rng.random() < 0.6:
+            back = board.move_stack[-2]
+            undo = chess.Move(back.to_square, back.from_square)
+            if board.is_legal(undo):
+                move = undo
+        board.push(move)
+        yield move
+
+
+class RepetitionTest(unittest.TestCase):
+    def assertSameRepetitions(self, board):
+        # A fresh board for each check: its first can_claim_threefold_repetition replays the stack
+        self.assertEqual(board.can_claim_threefold_repetition(), replayed(board).can_claim_threefold_repetition(), board.fen())
+        for count in (2, 3, 4):
+            self.assertEqual(board.is_repetition(count), replayed(board).is_repetition(count), (count, board.fen()))
+
+    def test_knight_shuffle(self):
+        board = chess.Board()
+        board.can_claim_threefold_repetition()
+        self.assertIsNotNone(board._repetitions)
+        for ply, uci in enumerate(KNIGHT_SHUFFLE * 2, 1):
+            board.push_uci(uci)
+            self.assertSameRepetitions(board)
+            # The third occurrence of the starting position can be claimed one ply before it is reached
+            self.assertEqual(board.can_claim_threefold_repetition(), ply >= 7)
+            self.assertEqual(board.is_repetition(), ply == 8)
+
+    def test_random_games(self):
+        rng = random.Random(0)
+        for board_type in (chess.Board, chess.variant.AtomicBoard, chess.variant.CrazyhouseBoard, chess.variant.ThreeCheckBoard):
+            for _ in range(3):
+                board = board_type()
+                board.can_claim_threefold_repetition()
+                for _ in play_random_moves(board, rng, 60):
+                    self.assertSameRepetitions(board)
+
+    def test_pop(self):
+        rng = random.Random(1)
+        for _ in range(3):
+            board = chess.Board()
+            board.can_claim_threefold_repetition()
+            list(play_random_moves(board, rng, 60))
+            while board.move_stack:
+                board.pop()
+                self.assertSameRepetitions(board)
+
+    def test_copy(self):
+        rng = random.Random(2)
+        for _ in range(3):
+            board = chess.Board()
+            board.can_claim_threefold_repetition()
+            list(play_random_moves(board, rng, 40))
+            for stack in (True, False, 10):
+                copied = board.copy(stack=stack)
+                self.assertSameRepetitions(copied)
+                for _ in play_random_moves(copied, rng, 20):
+                    self.assertSameRepetitions(copied)
+            # Moves on the copies leave the counts of the original alone
+            self.assertSameRepetitions(board)
+
+    def test_copy_counts_only_the_copied_stack(self):
+        board = chess.Board()
+        board.can_claim_threefold_repetition()
+        for uci in (KNIGHT_SHUFFLE * 2)[:7]:
+            board.push_uci(uci)
+        self.assertTrue(board.copy().can_claim_threefold_repetition())
+        # The copied stack starts at the second occurrence of the starting position
+        copied = board.copy(stack=3)
+        self.assertFalse(copied.can_claim_threefold_repetition())
+        self.assertSameRepetitions(copied)
+        copied.push_uci(KNIGHT_SHUFFLE[3])
+        self.assertTrue(copied.is_repetition(2))
+        self.assertFalse(copied.is_repetition())
+        self.assertSameRepetitions(copied)
+
+    def test_clear_stack(self):
+        rng = random.Random(3)
+        for _ in range(3):
+            board = chess.Board()
+            board.can_claim_threefold_repetition()
+            list(play_random_moves(board, rng, 40))
+            board.clear_stack()
+            self.assertSameRepetitions(board)
+            for _ in play_random_moves(board, rng, 40):
+                self.assertSameRepetitions(board)
+
+
+if __name__ == "__main__":
+    unittest.main()